@@ -0,0 +1,110 @@
+from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
+from sqlalchemy.orm import Session
+from uuid import uuid4
+from datetime import datetime
+import json
+
+from app.api.auth import get_current_user
+from app.vectorstore import get_chroma_collection
+from app.database import get_db, conversations, audit_jobs, audit_results
+from app.audit import run_audit, build_checklist, is_job_active, job_status, ISO_9001_CLAUSES
+from app.schemas.audit import AuditJobResponse, AuditReport
+
+router = APIRouter()
+
+def _get_owned_conversation(db: Session, convo_id: str, user_id: int):
+    query = conversations.select().where(
+        (conversations.c.id == convo_id) & (conversations.c.user_id == user_id)
+    )
+    if not db.execute(query).fetchone():
+        raise HTTPException(status_code=404, detail="Conversation not found")
+
+def _get_job(db: Session, convo_id: str, job_id: str):
+    job = db.execute(
+        audit_jobs.select().where((audit_jobs.c.id == job_id) & (audit_jobs.c.conversation_id == convo_id))
+    ).fetchone()
+    if not job:
+        raise HTTPException(status_code=404, detail="Audit job not found")
+    return job
+
+@router.post("/{convo_id}/audits", response_model=AuditJobResponse)
+def start_audit(convo_id: str, background_tasks: BackgroundTasks, current_user: dict = Depends(get_current_user), db: Session = Depends(get_db)):
+    """
+    Audits the conversation's uploaded documents against every ISO 9001 clause.
+    Runs in the background; poll the report endpoint for progress.
+    """
+    _get_owned_conversation(db, convo_id, current_user["id"])
+
+    collection = get_chroma_collection()
+    if not collection.get(where={"scope": convo_id}, limit=1, include=[])["ids"]:
+        raise HTTPException(status_code=400, detail="Upload documents to this conversation before auditing")
+
+    job_id = str(uuid4())
+    now = datetime.utcnow().isoformat()
+    total = len(build_checklist())
+    db.execute(audit_jobs.insert().values(
+        id=job_id,
+        conversation_id=convo_id,
+        status="pending",
+        total_clauses=total,
+        failed_clauses=0,
+        created_at=now,
+        updated_at=now
+    ))
+    db.commit()
+
+    background_tasks.add_task(run_audit, job_id, convo_id, collection)
+    return {"job_id": job_id, "status": "pending", "total_clauses": total}
+
+@router.post("/{convo_id}/audits/{job_id}/resume", response_model=AuditJobResponse)
+def resume_audit(convo_id: str, job_id: str, background_tasks: BackgroundTasks, current_user: dict = Depends(get_current_user), db: Session = Depends(get_db)):
+    """
+    Re-runs only the clauses that have no checkpointed result yet.
+    A running job whose worker stopped heartbeating counts as interrupted.
+    """
+    _get_owned_conversation(db, convo_id, current_user["id"])
+    job = _get_job(db, convo_id, job_id)
+    if is_job_active(job):
+        raise HTTPException(status_code=409, detail="Audit job is already running")
+
+    background_tasks.add_task(run_audit, job_id, convo_id, get_chroma_collection())
+    return {"job_id": job_id, "status": "pending", "total_clauses": job.total_clauses}
+
+@router.get("/{convo_id}/audits/{job_id}", response_model=AuditReport)
+def get_audit_report(convo_id: str, job_id: str, current_user: dict = Depends(get_current_user), db: Session = Depends(get_db)):
+    """
+    Returns the gap report (partial while the job is still running).
+    """
+    _get_owned_conversation(db, convo_id, current_user["id"])
+    job = _get_job(db, convo_id, job_id)
+
+    rows = db.execute(audit_results.select().where(audit_results.c.job_id == job_id)).fetchall()
+    # Report clauses in standard order rather than completion order
+    order = {clause_id: i for i, (clause_id, _) in enumerate(ISO_9001_CLAUSES)}
+    rows = sorted(rows, key=lambda r: order.get(r.clause_id, len(order)))
+
+    clauses = [
+        {
+            "clause_id": row.clause_id,
+            "title": row.clause_title,
+            "status": row.status,
+            "finding": row.finding or "",
+            "recommendation": row.recommendation or "",
+            "evidence": json.loads(row.evidence or "[]"),
+        }
+        for row in rows
+    ]
+    summary = {}
+    for c in clauses:
+        summary[c["status"]] = summary.get(c["status"], 0) + 1
+
+    return {
+        "job_id": job_id,
+        "status": job_status(job),
+        "total_clauses": job.total_clauses,
+        "evaluated_clauses": len(clauses),
+        "failed_clauses": job.failed_clauses or 0,
+        "summary": summary,
+        "gaps": [c for c in clauses if c["status"] in ("gap", "partial")],
+        "clauses": clauses,
+    }
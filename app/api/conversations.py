@@ -1,33 +1,42 @@
-from fastapi import APIRouter, UploadFile, File, Depends
+from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+import asyncio
 from uuid import uuid4
 from app.api.auth import get_current_user
 from sqlalchemy.orm import Session
-from app.database import get_db, conversations, messages
+from sqlalchemy import and_, or_, func
+from typing import List, Optional
+import json
+from app.database import get_db, SessionLocal, conversations, messages, chunk_links, audit_jobs
 from app.schemas.conversation import (
     ConversationCreateResponse,
-    ConversationListResponse
+    ConversationListResponse,
+    HistoryResponse
 )
 from app.schemas.chat import ChatRequest, ChatResponse
 from app.schemas.document import DocumentUploadResponse
-import chromadb
-from chromadb.config import Settings
+from app.vectorstore import get_chroma_collection, embed_texts
+from app.working_set import working_set, FOLLOWUP_INCREMENTAL_RESULTS
 from app.llm import get_llm_client
 from datetime import datetime
-from app.utils import process_file_stream
+from app.uploads import extract_chunks
+from app.indexing import index_document
+from app.dedup import forget_source
+from app.retention import delete_conversation
+from app.audit import active_job_filter
+from app.archive import read_history, iter_history, recent_messages
+from app.responses import FastJSONResponse, conditional_json, not_modified, weak_etag
+from app.singleflight import normalize_question, retrieval_flight, generation_flight
+from app.model_tiers import tier_policy
+from app.pagination import encode_cursor, decode_cursor, clamp_limit, DEFAULT_PAGE_SIZE
+from app.deadline import Deadline, RETRIEVAL_SHARE, HISTORY_SHARE, DEGRADE_BELOW_SECONDS, RESERVE_SECONDS
 import os
 from dotenv import load_dotenv
 
 load_dotenv()
 
-# Initialize ChromaDB Client
-chroma_client = chromadb.PersistentClient(
-    path="./data/chroma_db",
-    settings=Settings(anonymized_telemetry=False)
-)
-collection = chroma_client.get_or_create_collection("iso_docs")
-
-def get_chroma_collection():
-    return collection
+EMPTY_RESULT = {"ids": [[]], "documents": [[]], "metadatas": [[]], "distances": [[]]}
 
 router = APIRouter()
 
@@ -36,73 +45,317 @@ router = APIRouter()
 @router.post("/", response_model=ConversationCreateResponse)
 def create_conversation(current_user: dict = Depends(get_current_user), db: Session = Depends(get_db)):
     new_id = str(uuid4())
+    now = datetime.utcnow().isoformat()
     insert_stmt = conversations.insert().values(
         id=new_id,
         user_id=current_user["id"],
-        created_at=datetime.utcnow().isoformat()
+        created_at=now,
+        last_activity_at=now,
+        message_count=0
     )
     db.execute(insert_stmt)
     db.commit()
     return {"convo_id": new_id}
 
 @router.get("/", response_model=ConversationListResponse)
-def list_conversations(current_user: dict = Depends(get_current_user), db: Session = Depends(get_db)):
-    query = conversations.select().with_only_columns(conversations.c.id).where(conversations.c.user_id == current_user["id"])
-    result = db.execute(query).fetchall()
-    ids = [row.id for row in result]
-    return {"conversations": ids}
-
-@router.get("/{convo_id}/history")
-def get_conversation_history(convo_id: str, current_user: dict = Depends(get_current_user), db: Session = Depends(get_db)):
-    # Validate ownership
+def list_conversations(
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    sort: str = Query("created_at", pattern="^(created_at|last_activity)$"),
+    current_user: dict = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Newest first, keyset-paginated on (sort column, id): pass `next_cursor` back as `cursor`.
+    """
+    limit = clamp_limit(limit)
+    sort_col = conversations.c.last_activity_at if sort == "last_activity" else conversations.c.created_at
+
+    query = conversations.select().with_only_columns(
+        conversations.c.id,
+        conversations.c.created_at,
+        conversations.c.last_activity_at,
+        conversations.c.message_count
+    ).where(conversations.c.user_id == current_user["id"])
+
+    after = decode_cursor(cursor)
+    if after:
+        if len(after) != 2:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        sort_value, last_id = after
+        query = query.where(or_(
+            sort_col < sort_value,
+            and_(sort_col == sort_value, conversations.c.id < last_id)
+        ))
+
+    rows = db.execute(query.order_by(sort_col.desc(), conversations.c.id.desc()).limit(limit)).fetchall()
+
+    next_cursor = None
+    if len(rows) == limit:
+        last = rows[-1]
+        next_cursor = encode_cursor(last.last_activity_at if sort == "last_activity" else last.created_at, last.id)
+
+    return {
+        "conversations": [row.id for row in rows],
+        "items": [
+            {
+                "id": row.id,
+                "created_at": row.created_at,
+                "last_activity_at": row.last_activity_at,
+                "message_count": row.message_count or 0
+            }
+            for row in rows
+        ],
+        "next_cursor": next_cursor
+    }
+
+def _owns_conversation(db: Session, convo_id: str, user_id: int) -> bool:
     query = conversations.select().where(
-        (conversations.c.id == convo_id) & (conversations.c.user_id == current_user["id"])
+        (conversations.c.id == convo_id) & (conversations.c.user_id == user_id)
     )
-    if not db.execute(query).fetchone():
+    return db.execute(query).fetchone() is not None
+
+@router.get("/{convo_id}/history", response_model=HistoryResponse)
+def get_conversation_history(
+    request: Request,
+    convo_id: str,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    current_user: dict = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Oldest first, keyset-paginated on messages.id: pass `next_cursor` back as `cursor`.
+    Sends an ETag; polling with If-None-Match gets 304 until a new turn is saved.
+    """
+    # Validate ownership
+    convo = db.execute(conversations.select().where(
+        (conversations.c.id == convo_id) & (conversations.c.user_id == current_user["id"])
+    )).fetchone()
+    if not convo:
          return {"history": []}
 
-    msg_query = messages.select().where(messages.c.conversation_id == convo_id).order_by(messages.c.id.asc())
-    result = db.execute(msg_query).fetchall()
-    
-    msgs = [
-        {"role": row.role, "content": row.content, "timestamp": row.timestamp} 
-        for row in result
-    ]
-    return {"history": msgs}
+    limit = clamp_limit(limit, default=100)
+    after = decode_cursor(cursor)
+    if after and (len(after) != 1 or not isinstance(after[0], int)):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    # Every saved turn bumps message_count and last_activity_at: the page can be
+    # validated before any message is read
+    etag = weak_etag("history", convo_id, convo.message_count, convo.last_activity_at, limit, cursor)
+    cached = not_modified(request, etag)
+    if cached is not None:
+        return cached
+
+    # Reads the compressed archive, then the hot table
+    msgs = read_history(db, convo_id, after[0] if after else None, limit)
+    next_cursor = encode_cursor(msgs[-1]["id"]) if len(msgs) == limit else None
+    # Already in HistoryResponse's shape: returned as is, without a second validation pass
+    return conditional_json(request, {"history": msgs, "next_cursor": next_cursor}, etag)
+
+def _stream_history(convo_id: str):
+    # Own session: the request's session is closed before the body is streamed
+    db = SessionLocal()
+    try:
+        # Archive blocks are decompressed one at a time, hot rows fetched in batches
+        for message in iter_history(db, convo_id):
+            yield json.dumps(message) + "\n"
+    finally:
+        db.close()
+
+@router.get("/{convo_id}/history/export")
+def export_conversation_history(convo_id: str, current_user: dict = Depends(get_current_user), db: Session = Depends(get_db)):
+    """
+    Streams the whole history as NDJSON (one message per line).
+    """
+    if not _owns_conversation(db, convo_id, current_user["id"]):
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    return StreamingResponse(
+        _stream_history(convo_id),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{convo_id}.ndjson"'}
+    )
+
+@router.delete("/{convo_id}")
+def delete_conversation_endpoint(convo_id: str, current_user: dict = Depends(get_current_user), db: Session = Depends(get_db)):
+    """
+    Deletes the conversation, its messages, audits and uploaded documents.
+    """
+    if not _owns_conversation(db, convo_id, current_user["id"]):
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    running = db.execute(
+        audit_jobs.select().where((audit_jobs.c.conversation_id == convo_id) & active_job_filter())
+    ).fetchone()
+    if running:
+        raise HTTPException(status_code=409, detail="An audit is running on this conversation")
+
+    reclaimed = delete_conversation(db, get_chroma_collection(), convo_id)
+    return {
+        "status": "deleted",
+        "conversation_id": convo_id,
+        "chunks_removed": reclaimed["chunks"],
+        "bytes_reclaimed": reclaimed["bytes"]
+    }
 
 # 🟧 CHAT ENDPOINT
 
+CITATIONS_ONLY_ANSWER = (
+    "The answer could not be generated in time. "
+    "The most relevant passages are listed in the citations."
+)
+
+async def _embed_question(normalized: str) -> List[float]:
+    # Shared by identical concurrent questions like the queries themselves
+    vectors = await retrieval_flight.do(("embed", normalized), embed_texts, [normalized])
+    return vectors[0]
+
+async def _retrieve(collection, convo_id: str, normalized: str, deadline: Deadline, degradations: list):
+    """
+    Runs the local and global queries within the retrieval budget.
+    A scope that overruns or fails is dropped instead of failing the request.
+
+    Follow-ups of the previous turn reuse its chunks from the working set and
+    only run a small incremental search. The reused chunks are looked up by
+    id alongside it: only those still indexed unchanged are kept, re-scored
+    against the follow-up's search embedding.
+
+    Returns (results_local, results_global, search_embedding).
+    """
+    loop = asyncio.get_running_loop()
+    stage_end = loop.time() + deadline.stage(RETRIEVAL_SHARE)
+
+    try:
+        embedding = await asyncio.wait_for(_embed_question(normalized), timeout=stage_end - loop.time())
+    except asyncio.TimeoutError:
+        degradations.append("retrieval_timeout")
+        return EMPTY_RESULT, EMPTY_RESULT, None
+    except Exception as e:
+        print(f"Question embedding failed: {e}")
+        degradations.append("retrieval_failed")
+        return EMPTY_RESULT, EMPTY_RESULT, None
+
+    entry = working_set.get(convo_id)
+    follow_up = entry is not None and working_set.is_follow_up(entry, normalized, embedding)
+    if follow_up:
+        working_set.record_hit()
+        embedding = working_set.search_embedding(entry, embedding)
+        n_results = FOLLOWUP_INCREMENTAL_RESULTS
+    else:
+        n_results = 5
+
+    def search(scope):
+        # Identical concurrent questions share one in-flight query per scope.
+        # Follow-up searches are conversation specific (blended embedding).
+        key = ("followup", convo_id, scope, normalized) if follow_up else ("query", scope, normalized)
+        return asyncio.ensure_future(retrieval_flight.do(
+            key, collection.query, query_embeddings=[embedding], n_results=n_results, where={"scope": scope}
+        ))
+
+    tasks = {
+        convo_id: search(convo_id),
+        "global": search("global"),
+    }
+    waiting = list(tasks.values())
+    # Nothing to check (or reuse) when the previous turn retrieved nothing
+    reused_ids = working_set.reused_ids(entry) if follow_up else []
+    if reused_ids:
+        # Another worker may have deleted or replaced them since they were cached
+        validation = asyncio.ensure_future(run_in_threadpool(
+            collection.get, ids=reused_ids, include=["documents", "embeddings"]
+        ))
+        waiting.append(validation)
+    await asyncio.wait(waiting, timeout=max(0.0, stage_end - loop.time()))
+
+    current = {}
+    if reused_ids:
+        # Unverified chunks are not reused: the incremental results stand alone
+        if not validation.done():
+            validation.cancel()
+        elif validation.exception() is not None:
+            print(f"Working set validation failed: {validation.exception()}")
+        else:
+            found = validation.result()
+            embeddings = found.get("embeddings")
+            if embeddings is not None:
+                current = dict(zip(found["ids"], zip(found["documents"] or [], embeddings)))
+
+    results = {}
+    for scope, task in tasks.items():
+        label = "local" if scope == convo_id else "global"
+        if not task.done():
+            # Only this request stops waiting; the shared query keeps running for others
+            task.cancel()
+            degradations.append(f"{label}_retrieval_timeout")
+            results[scope] = EMPTY_RESULT
+        elif task.exception() is not None:
+            print(f"{label} retrieval failed: {task.exception()}")
+            degradations.append(f"{label}_retrieval_failed")
+            results[scope] = EMPTY_RESULT
+        else:
+            results[scope] = task.result()
+        if follow_up:
+            results[scope] = working_set.merge(entry, scope, results[scope], current, embedding)
+    return results[convo_id], results["global"], embedding
+
+def _load_recent_history(convo_id: str):
+    # Own session: the request session must not be shared with a thread we may abandon
+    db = SessionLocal()
+    try:
+        # Fetch last 6 messages (3 turns), from the archive if the conversation was idle
+        return [{"role": m["role"], "content": m["content"]} for m in recent_messages(db, convo_id, 6)]
+    finally:
+        db.close()
+
+def _shrink(res: dict, keep: int) -> dict:
+    shrunk = dict(res)
+    for key in ("ids", "documents", "metadatas", "distances"):
+        if res.get(key):
+            shrunk[key] = [res[key][0][:keep]]
+    return shrunk
+
 @router.post("/{convo_id}/ask", response_model=ChatResponse)
 async def ask_question(convo_id: str, payload: ChatRequest, current_user: dict = Depends(get_current_user), db: Session = Depends(get_db)):
-    try:
-        # Validate ownership
-        query = conversations.select().where(
-            (conversations.c.id == convo_id) & (conversations.c.user_id == current_user["id"])
-        )
-        if not db.execute(query).fetchone():
-             return {"answer": "Access Denied: You do not own this conversation.", "citations": []}
+    deadline = Deadline()
+    degradations = []
 
+    # Validate ownership
+    query = conversations.select().where(
+        (conversations.c.id == convo_id) & (conversations.c.user_id == current_user["id"])
+    )
+    if not db.execute(query).fetchone():
+        raise HTTPException(status_code=403, detail="Access Denied: You do not own this conversation.")
+
+    try:
         question = payload.message
+        normalized = normalize_question(question)
         
         # 1. Vector Search (Hybrid Strategy)
         collection = get_chroma_collection()
         
         # Strategy: Query global and local separately to ensure representation from both
         # This prevents large global corpora from drowning out specific local files
-        
-        # A. Local Scope Query
-        results_local = collection.query(
-            query_texts=[question],
-            n_results=5,
-            where={"scope": convo_id}
+        results_local, results_global, search_embedding = await _retrieve(
+            collection, convo_id, normalized, deadline, degradations
         )
+        if search_embedding is not None:
+            # Next turn may be a follow-up of this one
+            working_set.put(convo_id, normalized, search_embedding, {convo_id: results_local, "global": results_global})
         
-        # B. Global Scope Query
-        results_global = collection.query(
-            query_texts=[question],
-            n_results=5,
-            where={"scope": "global"}
-        )
+        # Build Message History
+        try:
+            history_messages = await asyncio.wait_for(
+                run_in_threadpool(_load_recent_history, convo_id),
+                timeout=deadline.stage(HISTORY_SHARE)
+            )
+        except asyncio.TimeoutError:
+            degradations.append("history_dropped")
+            history_messages = []
+        
+        # Running late: keep fewer chunks per scope and prefer the fast tier
+        short_on_time = deadline.remaining() < DEGRADE_BELOW_SECONDS
+        if short_on_time:
+            results_local, results_global = _shrink(results_local, 2), _shrink(results_global, 2)
+            degradations.append("context_shrunk")
         
         # Merge Results
         context_text = ""
@@ -141,45 +394,86 @@ async def ask_question(convo_id: str, payload: ChatRequest, current_user: dict =
         Context:
         {context_text}
         """
-        
-        # Build Message History
-        # Fetch last 6 messages (3 turns)
-        msg_query = messages.select().where(messages.c.conversation_id == convo_id).order_by(messages.c.id.desc()).limit(6)
-        history_rows = db.execute(msg_query).fetchall()[::-1]
-        
-        history_messages = [{"role": row.role, "content": row.content} for row in history_rows]
 
         # Get Generic LLM Client
         llm_client = get_llm_client()
         
+        # Pick a model tier (explicit settings.model takes priority)
+        explicit_model = None
+        if payload.settings and "model" in payload.settings.model_fields_set:
+            explicit_model = payload.settings.model
+        distances = [
+            d for res in (results_local, results_global)
+            if res.get("distances") and res["distances"][0]
+            for d in res["distances"][0]
+        ]
+        tier, model_name = tier_policy.select(question, distances, len(history_messages), explicit_model)
+        if short_on_time and tier == "strong":
+            tier, model_name = "fast", tier_policy.models["fast"]
+            degradations.append("fast_model_fallback")
+        
         # Generate Answer
-        model_name = payload.settings.model if payload.settings and payload.settings.model else None
-        answer = llm_client.generate_answer(system_prompt, history_messages, question, model=model_name)
+        if history_messages:
+            generation = tier_policy.agenerate_answer(
+                llm_client, tier, system_prompt, history_messages, question, model=model_name
+            )
+        else:
+            # Without history the answer depends only on the question and its context,
+            # so a burst of fresh conversations asking the same thing shares one generation
+            scopes = tuple(
+                scope for scope, res in ((convo_id, results_local), ("global", results_global))
+                if res["documents"] and res["documents"][0]
+            )
+            generation = generation_flight.do(
+                ("answer", normalized, scopes, model_name, system_prompt),
+                tier_policy.agenerate_answer, llm_client, tier, system_prompt, [], question, model=model_name
+            )
         
-        # 3. Save History
         try:
-            timestamp = datetime.utcnow().isoformat()
-            db.execute(messages.insert().values(
-                conversation_id=convo_id, role="user", content=question, timestamp=timestamp
-            ))
-            db.execute(messages.insert().values(
-                conversation_id=convo_id, role="assistant", content=answer, timestamp=timestamp
-            ))
-            db.commit()
+            answer = await asyncio.wait_for(generation, timeout=max(0.0, deadline.remaining() - RESERVE_SECONDS))
+        except asyncio.TimeoutError:
+            if not citations:
+                raise HTTPException(status_code=504, detail="The answer could not be generated in time.")
+            degradations.append("citations_only")
+            answer = None
         except Exception as e:
-            print(f"Error saving history: {e}")
+            print(f"Generation failed: {e}")
+            if not citations:
+                raise HTTPException(status_code=503, detail="No language model is available right now.")
+            degradations.append("citations_only")
+            answer = None
+        
+        # 3. Save History (a citations-only reply is not a real answer: keep it out of the context of later turns)
+        if answer is not None:
+            try:
+                timestamp = datetime.utcnow().isoformat()
+                db.execute(messages.insert().values(
+                    conversation_id=convo_id, role="user", content=question, timestamp=timestamp
+                ))
+                db.execute(messages.insert().values(
+                    conversation_id=convo_id, role="assistant", content=answer, timestamp=timestamp
+                ))
+                db.execute(conversations.update().where(conversations.c.id == convo_id).values(
+                    last_activity_at=timestamp,
+                    message_count=func.coalesce(conversations.c.message_count, 0) + 2
+                ))
+                db.commit()
+            except Exception as e:
+                print(f"Error saving history: {e}")
 
-        return {
-            "answer": answer,
-            "citations": citations
-        }
+        # Already in ChatResponse's shape: rendered directly, without a second validation pass
+        return FastJSONResponse({
+            "answer": answer if answer is not None else CITATIONS_ONLY_ANSWER,
+            "citations": citations,
+            "degraded": bool(degradations),
+            "degradations": degradations
+        })
+    except HTTPException:
+        raise
     except Exception as e:
         import traceback
         traceback.print_exc()
-        return {
-            "answer": f"Error: {str(e)}",
-            "citations": []
-        }
+        raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
 # 🟩 DOCUMENT MANAGEMENT
 
@@ -192,35 +486,15 @@ def upload_document(convo_id: str, file: UploadFile = File(...), current_user: d
     if not db.execute(query).fetchone():
          return {"status": "error", "chunks_added": 0}
 
-    # 1. Process File (PDF/Excel/MD)
+    # 1. Process File (PDF/Excel/MD), memory-mapped from the upload spool; 413 past the limits
+    upload = extract_chunks(file.file, file.filename)
     try:
-        # Read file into memory
-        chunks = process_file_stream(file.file, file.filename)
-        
-        # 2. Add to ChromaDB with Scope (Upsert)
+        # 2. Add to ChromaDB with Scope (Upsert), skipping near duplicates
         collection = get_chroma_collection()
-        ids = []
-        from app.utils import generate_chunk_id
+        result = index_document(collection, db, convo_id, file.filename, upload["chunks"])
+        working_set.invalidate(convo_id)
         
-        for i, chunk in enumerate(chunks):
-            # OLD: chunk_id = f"{convo_id}_{file.filename}_{i}"
-            chunk_id = generate_chunk_id(convo_id, file.filename, i)
-            ids.append(chunk_id)
-            
-        collection.upsert(
-            documents=chunks,
-            metadatas=[{
-                "source": file.filename, 
-                "page": "auto",
-                "scope": convo_id
-            } for _ in chunks],
-            ids=ids
-        )
-        
-        return {
-            "status": "ok",
-            "chunks_added": len(chunks)
-        }
+        return {"status": "ok", "bytes": upload["bytes"], "sha256": upload["sha256"], **result}
     except Exception as e:
         print(f"Upload failed: {e}")
         return {
@@ -228,8 +502,15 @@ def upload_document(convo_id: str, file: UploadFile = File(...), current_user: d
             "chunks_added": 0
         }
 
+def _linked_sources(db: Session, scope: str) -> set:
+    # Documents made only of duplicates have no chunks of their own in Chroma
+    rows = db.execute(
+        chunk_links.select().with_only_columns(chunk_links.c.source).where(chunk_links.c.scope == scope).distinct()
+    ).fetchall()
+    return {row.source for row in rows}
+
 @router.get("/{convo_id}/documents")
-def list_documents(convo_id: str, current_user: dict = Depends(get_current_user)):
+def list_documents(request: Request, convo_id: str, current_user: dict = Depends(get_current_user), db: Session = Depends(get_db)):
     # This is tricky with Chroma, we need to query by metadata
     # Implementing simple count for now
     collection = get_chroma_collection()
@@ -240,8 +521,10 @@ def list_documents(convo_id: str, current_user: dict = Depends(get_current_user)
         for m in result["metadatas"]:
             if "source" in m:
                 sources.add(m["source"])
+    sources |= _linked_sources(db, convo_id)
     
-    return {"documents": list(sources)}
+    # Sorted so an unchanged listing keeps its ETag
+    return conditional_json(request, {"documents": sorted(sources)})
 
 @router.delete("/{convo_id}/documents/{filename}")
 def delete_document(convo_id: str, filename: str, current_user: dict = Depends(get_current_user), db: Session = Depends(get_db)):
@@ -265,13 +548,24 @@ def delete_document(convo_id: str, filename: str, current_user: dict = Depends(g
                 ]
             }
         )
+        # Duplicates elsewhere in this conversation that pointed at the deleted chunks take their place
+        promoted = forget_source(db, convo_id, filename)
+        if promoted:
+            collection.upsert(
+                ids=[p["id"] for p in promoted],
+                documents=[p["document"] for p in promoted],
+                metadatas=[p["metadata"] for p in promoted]
+            )
+        db.commit()
+        working_set.invalidate(convo_id)
         return {"status": "deleted", "file": filename}
     except Exception as e:
+        db.rollback()
         print(f"Delete failed: {e}")
         return {"status": "error", "detail": str(e)}
 
 @router.get("/documents/global")
-def list_global_documents(current_user: dict = Depends(get_current_user)):
+def list_global_documents(request: Request, current_user: dict = Depends(get_current_user), db: Session = Depends(get_db)):
     """
     List all documents in the Global Knowledge Base.
     """
@@ -289,42 +583,25 @@ def list_global_documents(current_user: dict = Depends(get_current_user)):
         for m in result["metadatas"]:
             if "source" in m:
                 sources.add(m["source"])
+    sources |= _linked_sources(db, "global")
     
-    return {"documents": list(sources)}
+    return conditional_json(request, {"documents": sorted(sources)})
 
 @router.post("/documents/global", response_model=DocumentUploadResponse)
-def upload_global_document(file: UploadFile = File(...), current_user: dict = Depends(get_current_user)):
+def upload_global_document(file: UploadFile = File(...), current_user: dict = Depends(get_current_user), db: Session = Depends(get_db)):
     """
     Upload a document to the Global Knowledge Base.
     Accessible to ALL users and conversations.
     """
+    # 1. Process File; 413 past the size/page limits
+    upload = extract_chunks(file.file, file.filename)
     try:
-        # 1. Process File
-        chunks = process_file_stream(file.file, file.filename)
-        
-        # 2. Add to ChromaDB with Scope="global" (Upsert)
+        # 2. Add to ChromaDB with Scope="global" (Upsert), skipping near duplicates
         collection = get_chroma_collection()
-        ids = []
-        from app.utils import generate_chunk_id
-        
-        for i, chunk in enumerate(chunks):
-            chunk_id = generate_chunk_id("global", file.filename, i)
-            ids.append(chunk_id)
-            
-        collection.upsert(
-            documents=chunks,
-            metadatas=[{
-                "source": file.filename, 
-                "page": "auto",
-                "scope": "global"
-            } for _ in chunks],
-            ids=ids
-        )
+        result = index_document(collection, db, "global", file.filename, upload["chunks"])
+        working_set.clear()
         
-        return {
-            "status": "ok",
-            "chunks_added": len(chunks)
-        }
+        return {"status": "ok", "bytes": upload["bytes"], "sha256": upload["sha256"], **result}
     except Exception as e:
         print(f"Global upload failed: {e}")
         return {
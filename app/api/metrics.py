@@ -0,0 +1,23 @@
+from fastapi import APIRouter, Depends
+from app.api.auth import get_current_user
+from app.llm import get_llm_client
+from app.model_tiers import tier_policy
+from app.singleflight import retrieval_flight, generation_flight
+from app.working_set import working_set
+from app.retention import retention_sweeper
+
+router = APIRouter()
+
+@router.get("/")
+def get_metrics(current_user: dict = Depends(get_current_user)):
+    """
+    Runtime counters used to tune routing thresholds and check coalescing.
+    """
+    llm_client = get_llm_client()
+    return {
+        "llm_backends": llm_client.snapshot() if hasattr(llm_client, "snapshot") else {},
+        "model_tiers": tier_policy.snapshot(),
+        "coalescing": [retrieval_flight.stats(), generation_flight.stats()],
+        "retrieval_working_set": working_set.stats(),
+        "retention": retention_sweeper.stats(),
+    }
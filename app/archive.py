@@ -0,0 +1,263 @@
+"""
+Hot/cold tiering of the message history.
+
+`messages` is the hot tier. Messages of conversations idle for more than
+ARCHIVE_IDLE_DAYS are moved into `message_archive`: blocks of up to
+ARCHIVE_BLOCK_MESSAGES consecutive messages, serialized as JSON and
+compressed (zstd when the `zstandard` package is installed, zlib otherwise).
+Message ids are kept and never reused (AUTOINCREMENT on SQLite, see
+app/database.py), and archived messages are always older than the hot ones
+of their conversation, so readers go through the cold blocks and then the
+hot rows in id order.
+
+A conversation that becomes active again writes new messages to the hot
+tier; they are archived in new blocks once it is idle again.
+
+    python -m app.archive compact [--idle-days N]
+    python -m app.archive stats
+"""
+import argparse
+import json
+import os
+import zlib
+from datetime import datetime, timedelta
+from typing import Iterator, List, Optional
+
+from sqlalchemy import func
+
+from app.database import SessionLocal, conversations, messages, message_archive
+
+try:
+    import zstandard
+except ImportError:  # optional: zlib is used instead
+    zstandard = None
+
+ARCHIVE_IDLE_DAYS = float(os.getenv("ARCHIVE_IDLE_DAYS", "30"))
+ARCHIVE_BLOCK_MESSAGES = int(os.getenv("ARCHIVE_BLOCK_MESSAGES", "200"))
+# Conversations archived per compaction run
+ARCHIVE_BATCH = int(os.getenv("ARCHIVE_BATCH", "200"))
+ZSTD_LEVEL = 9
+ZLIB_LEVEL = 6
+
+DEFAULT_CODEC = "zstd" if zstandard is not None else "zlib"
+
+
+def _compress(raw: bytes, codec: str) -> bytes:
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(raw)
+    return zlib.compress(raw, ZLIB_LEVEL)
+
+
+def _decompress(payload: bytes, codec: str) -> bytes:
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("This archive block is zstd-compressed: install the zstandard package")
+        return zstandard.ZstdDecompressor().decompress(payload)
+    return zlib.decompress(payload)
+
+
+def _row_to_message(row) -> dict:
+    return {"id": row.id, "role": row.role, "content": row.content, "timestamp": row.timestamp}
+
+
+def _block_messages(block) -> List[dict]:
+    return json.loads(_decompress(block.payload, block.codec))
+
+
+def _archive_conversation(db, convo_id: str, codec: str) -> int:
+    rows = db.execute(
+        messages.select().where(messages.c.conversation_id == convo_id).order_by(messages.c.id.asc())
+    ).fetchall()
+    now = datetime.utcnow().isoformat()
+    for start in range(0, len(rows), ARCHIVE_BLOCK_MESSAGES):
+        block = rows[start:start + ARCHIVE_BLOCK_MESSAGES]
+        raw = json.dumps([_row_to_message(row) for row in block], ensure_ascii=False).encode("utf-8")
+        payload = _compress(raw, codec)
+        db.execute(message_archive.insert().values(
+            conversation_id=convo_id,
+            first_message_id=block[0].id,
+            last_message_id=block[-1].id,
+            message_count=len(block),
+            codec=codec,
+            raw_bytes=len(raw),
+            compressed_bytes=len(payload),
+            payload=payload,
+            created_at=now
+        ))
+    if rows:
+        db.execute(messages.delete().where(
+            (messages.c.conversation_id == convo_id) & (messages.c.id <= rows[-1].id)
+        ))
+    return len(rows)
+
+
+def compact(db, idle_days: float = ARCHIVE_IDLE_DAYS, limit: int = ARCHIVE_BATCH, codec: str = DEFAULT_CODEC) -> dict:
+    """
+    Moves the hot messages of up to `limit` conversations idle for more than
+    `idle_days` into compressed blocks. Each conversation is committed on its own.
+    """
+    report = {"conversations": 0, "messages": 0}
+    cutoff = (datetime.utcnow() - timedelta(days=idle_days)).isoformat()
+    last_activity = func.coalesce(conversations.c.last_activity_at, conversations.c.created_at)
+    has_hot = messages.select().with_only_columns(messages.c.id).where(
+        messages.c.conversation_id == conversations.c.id
+    ).exists()
+    idle = db.execute(
+        conversations.select().with_only_columns(conversations.c.id).where(
+            (last_activity < cutoff) & has_hot
+        ).limit(limit)
+    ).scalars().all()
+
+    for convo_id in idle:
+        try:
+            archived = _archive_conversation(db, convo_id, codec)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        report["conversations"] += 1
+        report["messages"] += archived
+    return report
+
+
+def iter_history(db, convo_id: str, after_id: Optional[int] = None) -> Iterator[dict]:
+    """
+    All messages of a conversation in id order, cold blocks first. Blocks are
+    decompressed one at a time, only once the reader gets to them.
+    """
+    block_query = message_archive.select().where(message_archive.c.conversation_id == convo_id)
+    if after_id is not None:
+        block_query = block_query.where(message_archive.c.last_message_id > after_id)
+    # Only block ids are listed upfront: payloads are loaded one by one
+    block_ids = db.execute(
+        block_query.with_only_columns(message_archive.c.id).order_by(message_archive.c.first_message_id.asc())
+    ).scalars().all()
+    last_id = after_id
+    for block_id in block_ids:
+        block = db.execute(message_archive.select().where(message_archive.c.id == block_id)).fetchone()
+        for message in _block_messages(block):
+            if after_id is None or message["id"] > after_id:
+                last_id = message["id"]
+                yield message
+
+    hot_query = messages.select().where(messages.c.conversation_id == convo_id)
+    if last_id is not None:
+        hot_query = hot_query.where(messages.c.id > last_id)
+    result = db.execute(
+        hot_query.order_by(messages.c.id.asc()).execution_options(stream_results=True, yield_per=500)
+    )
+    for row in result:
+        yield _row_to_message(row)
+
+
+def read_history(db, convo_id: str, after_id: Optional[int], limit: int) -> List[dict]:
+    """One page of history across both tiers."""
+    page = []
+    # The hot tier is read with a plain LIMIT query once the cold blocks are exhausted
+    has_cold = db.execute(
+        message_archive.select().with_only_columns(message_archive.c.id).where(
+            (message_archive.c.conversation_id == convo_id)
+            & (message_archive.c.last_message_id > (after_id or 0))
+        ).limit(1)
+    ).fetchone()
+    if not has_cold:
+        hot_query = messages.select().where(messages.c.conversation_id == convo_id)
+        if after_id is not None:
+            hot_query = hot_query.where(messages.c.id > after_id)
+        rows = db.execute(hot_query.order_by(messages.c.id.asc()).limit(limit)).fetchall()
+        return [_row_to_message(row) for row in rows]
+
+    history = iter_history(db, convo_id, after_id)
+    try:
+        for message in history:
+            page.append(message)
+            if len(page) == limit:
+                break
+    finally:
+        # Releases the hot-tier cursor if the page ended before it was exhausted
+        history.close()
+    return page
+
+
+def recent_messages(db, convo_id: str, n: int) -> List[dict]:
+    """The last `n` messages, oldest first. Falls back to the newest cold blocks when the hot tier has fewer."""
+    rows = db.execute(
+        messages.select().where(messages.c.conversation_id == convo_id).order_by(messages.c.id.desc()).limit(n)
+    ).fetchall()
+    recent = [_row_to_message(row) for row in rows]
+    if len(recent) < n:
+        blocks = db.execute(
+            message_archive.select().where(message_archive.c.conversation_id == convo_id)
+            .order_by(message_archive.c.last_message_id.desc())
+        )
+        for block in blocks:
+            recent.extend(reversed(_block_messages(block)))
+            if len(recent) >= n:
+                break
+    return recent[:n][::-1]
+
+
+def delete_archive(db, convo_id: str):
+    db.execute(message_archive.delete().where(message_archive.c.conversation_id == convo_id))
+
+
+def stats(db) -> dict:
+    hot = db.execute(
+        messages.select().with_only_columns(func.count(), func.coalesce(func.sum(func.length(messages.c.content)), 0))
+    ).one()
+    cold = db.execute(
+        message_archive.select().with_only_columns(
+            func.count(),
+            func.coalesce(func.sum(message_archive.c.message_count), 0),
+            func.coalesce(func.sum(message_archive.c.raw_bytes), 0),
+            func.coalesce(func.sum(message_archive.c.compressed_bytes), 0),
+        )
+    ).one()
+    codecs = dict(db.execute(
+        message_archive.select().with_only_columns(message_archive.c.codec, func.count()).group_by(message_archive.c.codec)
+    ).all())
+    return {
+        "hot": {"messages": hot[0], "content_chars": hot[1]},
+        "cold": {
+            "blocks": cold[0],
+            "messages": cold[1],
+            "raw_bytes": cold[2],
+            "compressed_bytes": cold[3],
+            "compression_ratio": round(cold[2] / cold[3], 2) if cold[3] else 0.0,
+            "codecs": codecs,
+        },
+        "archived_share": round(cold[1] / (hot[0] + cold[1]), 4) if hot[0] + cold[1] else 0.0,
+        "default_codec": DEFAULT_CODEC,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Hot/cold message archive")
+    sub = parser.add_subparsers(dest="command", required=True)
+    compact_parser = sub.add_parser("compact", help="Archive the messages of idle conversations")
+    compact_parser.add_argument("--idle-days", type=float, default=ARCHIVE_IDLE_DAYS)
+    compact_parser.add_argument("--all", action="store_true", help="Repeat until no idle conversation is left")
+    sub.add_parser("stats", help="Hot table size and archive compression ratio")
+    args = parser.parse_args(argv)
+
+    from app.database import init_db
+    init_db()
+    db = SessionLocal()
+    try:
+        if args.command == "compact":
+            total = {"conversations": 0, "messages": 0}
+            while True:
+                report = compact(db, idle_days=args.idle_days)
+                total["conversations"] += report["conversations"]
+                total["messages"] += report["messages"]
+                if not args.all or report["conversations"] < ARCHIVE_BATCH:
+                    break
+            print(json.dumps(total, indent=2))
+        else:
+            print(json.dumps(stats(db), indent=2))
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
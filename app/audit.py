@@ -0,0 +1,257 @@
+import asyncio
+import json
+import os
+import re
+from datetime import datetime, timedelta
+from typing import List, Dict, Any
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.exc import IntegrityError
+
+from app.database import SessionLocal, audit_jobs, audit_results
+from app.llm import get_llm_client
+
+# Max clauses evaluated at once (each holds one retrieval + one LLM call)
+AUDIT_CONCURRENCY = int(os.getenv("AUDIT_CONCURRENCY", "8"))
+# A running job refreshes updated_at every AUDIT_STALE_SECONDS / 4; past
+# AUDIT_STALE_SECONDS without it, its worker is gone (restart, crash)
+AUDIT_STALE_SECONDS = float(os.getenv("AUDIT_STALE_SECONDS", "120"))
+
+# ISO 9001:2015 requirement clauses (sections 4 to 10).
+# The titles are used as retrieval queries against the global corpus,
+# which supplies the actual requirement text for each clause.
+ISO_9001_CLAUSES = [
+    ("4.1", "Understanding the organization and its context"),
+    ("4.2", "Understanding the needs and expectations of interested parties"),
+    ("4.3", "Determining the scope of the quality management system"),
+    ("4.4", "Quality management system and its processes"),
+    ("5.1.1", "Leadership and commitment - General"),
+    ("5.1.2", "Customer focus"),
+    ("5.2", "Quality policy"),
+    ("5.3", "Organizational roles, responsibilities and authorities"),
+    ("6.1", "Actions to address risks and opportunities"),
+    ("6.2", "Quality objectives and planning to achieve them"),
+    ("6.3", "Planning of changes"),
+    ("7.1.2", "Resources - People"),
+    ("7.1.3", "Infrastructure"),
+    ("7.1.4", "Environment for the operation of processes"),
+    ("7.1.5", "Monitoring and measuring resources"),
+    ("7.1.6", "Organizational knowledge"),
+    ("7.2", "Competence"),
+    ("7.3", "Awareness"),
+    ("7.4", "Communication"),
+    ("7.5.2", "Documented information - Creating and updating"),
+    ("7.5.3", "Control of documented information"),
+    ("8.1", "Operational planning and control"),
+    ("8.2", "Requirements for products and services"),
+    ("8.3", "Design and development of products and services"),
+    ("8.4", "Control of externally provided processes, products and services"),
+    ("8.5.1", "Control of production and service provision"),
+    ("8.5.2", "Identification and traceability"),
+    ("8.5.3", "Property belonging to customers or external providers"),
+    ("8.5.4", "Preservation"),
+    ("8.5.5", "Post-delivery activities"),
+    ("8.5.6", "Control of changes"),
+    ("8.6", "Release of products and services"),
+    ("8.7", "Control of nonconforming outputs"),
+    ("9.1.2", "Customer satisfaction"),
+    ("9.1.3", "Analysis and evaluation"),
+    ("9.2", "Internal audit"),
+    ("9.3", "Management review"),
+    ("10.1", "Improvement - General"),
+    ("10.2", "Nonconformity and corrective action"),
+    ("10.3", "Continual improvement"),
+]
+
+VALID_STATUSES = {"conforming", "partial", "gap", "not_applicable"}
+
+EVALUATION_PROMPT = """You are an ISO 9001 lead auditor. Evaluate whether the organization's documents satisfy the requirement below.
+Answer ONLY with a JSON object of the form:
+{{"status": "conforming" | "partial" | "gap" | "not_applicable", "finding": "...", "recommendation": "..."}}
+
+Requirement (ISO 9001:2015 clause {clause_id} - {title}):
+{requirement}
+
+Organization documents:
+{evidence}
+"""
+
+
+def build_checklist() -> List[Dict[str, Any]]:
+    """
+    Returns the clause checklist. The requirement text of each clause is
+    retrieved from the global corpus when the clause is evaluated, so the
+    lookups run in parallel with everything else.
+    """
+    return [{"clause_id": clause_id, "title": title} for clause_id, title in ISO_9001_CLAUSES]
+
+
+def _retrieve_requirement(collection, clause_id: str, title: str) -> str:
+    res = collection.query(
+        query_texts=[f"{clause_id} {title}"],
+        n_results=2,
+        where={"scope": "global"}
+    )
+    docs = res["documents"][0] if res["documents"] else []
+    return "\n---\n".join(docs) if docs else title
+
+
+def _parse_evaluation(raw: str) -> Dict[str, str]:
+    """
+    Raises ValueError when the reply holds no verdict: the clause is then
+    counted as failed (and re-evaluated on resume) instead of reported as a gap.
+    """
+    # Models sometimes wrap the JSON in prose or code fences
+    match = re.search(r"\{.*\}", raw or "", re.DOTALL)
+    if not match:
+        raise ValueError(f"No JSON verdict in the model reply: {(raw or '')[:200]!r}")
+    data = json.loads(match.group(0))
+    if not isinstance(data, dict):
+        raise ValueError("The model verdict is not a JSON object")
+    status = str(data.get("status", "")).lower().strip()
+    if status not in VALID_STATUSES:
+        raise ValueError(f"Unknown verdict status {status!r}")
+    return {
+        "status": status,
+        "finding": data.get("finding") or (raw or "").strip(),
+        "recommendation": data.get("recommendation") or "",
+    }
+
+
+def evaluate_clause(collection, convo_id: str, clause: Dict[str, Any]) -> Dict[str, Any]:
+    """Runs retrieval for one clause and asks the LLM for a verdict (blocking)."""
+    clause_id, title = clause["clause_id"], clause["title"]
+    requirement = _retrieve_requirement(collection, clause_id, title)
+
+    res = collection.query(
+        query_texts=[f"{title}\n{requirement[:500]}"],
+        n_results=4,
+        where={"scope": convo_id}
+    )
+    evidence_docs = res["documents"][0] if res["documents"] else []
+    evidence_ids = res["ids"][0] if res["ids"] else []
+    evidence_metas = res["metadatas"][0] if res["metadatas"] else []
+
+    evidence_text = "\n---\n".join(
+        f"Source: {meta.get('source', 'Unknown')}\nContent: {doc}"
+        for doc, meta in zip(evidence_docs, evidence_metas)
+    ) or "No relevant content found in the organization documents."
+
+    prompt = EVALUATION_PROMPT.format(
+        clause_id=clause_id, title=title, requirement=requirement, evidence=evidence_text
+    )
+    raw = get_llm_client().generate_answer(prompt, [], f"Evaluate clause {clause_id}.")
+    verdict = _parse_evaluation(raw)
+    verdict["evidence"] = evidence_ids
+    return verdict
+
+
+def _save_result(job_id: str, clause: Dict[str, Any], verdict: Dict[str, Any]):
+    db = SessionLocal()
+    try:
+        db.execute(audit_results.insert().values(
+            job_id=job_id,
+            clause_id=clause["clause_id"],
+            clause_title=clause["title"],
+            status=verdict["status"],
+            finding=verdict["finding"],
+            recommendation=verdict["recommendation"],
+            evidence=json.dumps(verdict["evidence"]),
+            created_at=datetime.utcnow().isoformat()
+        ))
+        db.commit()
+    except IntegrityError:
+        # Clause already checkpointed by a concurrent resume
+        db.rollback()
+    finally:
+        db.close()
+
+
+def _set_job_status(job_id: str, **values):
+    db = SessionLocal()
+    try:
+        db.execute(
+            audit_jobs.update().where(audit_jobs.c.id == job_id).values(
+                updated_at=datetime.utcnow().isoformat(), **values
+            )
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+def _stale_cutoff() -> str:
+    return (datetime.utcnow() - timedelta(seconds=AUDIT_STALE_SECONDS)).isoformat()
+
+
+def active_job_filter():
+    """Jobs whose worker is alive: running, with a recent heartbeat."""
+    return (audit_jobs.c.status == "running") & (audit_jobs.c.updated_at >= _stale_cutoff())
+
+
+def is_job_active(job) -> bool:
+    return job.status == "running" and (job.updated_at or "") >= _stale_cutoff()
+
+
+def job_status(job) -> str:
+    """The job's status, "interrupted" for a running job whose worker is gone."""
+    if job.status == "running" and not is_job_active(job):
+        return "interrupted"
+    return job.status
+
+
+async def _heartbeat(job_id: str):
+    while True:
+        await asyncio.sleep(AUDIT_STALE_SECONDS / 4)
+        try:
+            await run_in_threadpool(_set_job_status, job_id)
+        except Exception as e:
+            print(f"Audit {job_id}: heartbeat failed: {e}")
+
+
+def completed_clause_ids(db, job_id: str) -> set:
+    rows = db.execute(
+        audit_results.select().with_only_columns(audit_results.c.clause_id).where(audit_results.c.job_id == job_id)
+    ).fetchall()
+    return {row.clause_id for row in rows}
+
+
+async def run_audit(job_id: str, convo_id: str, collection):
+    """
+    Evaluates every clause not yet checkpointed for this job.
+    Clauses run in parallel (bounded by AUDIT_CONCURRENCY) and each result is
+    persisted as soon as it is ready, so a failed or interrupted run can be resumed.
+    """
+    db = SessionLocal()
+    try:
+        done = completed_clause_ids(db, job_id)
+    finally:
+        db.close()
+
+    checklist = build_checklist()
+    pending = [c for c in checklist if c["clause_id"] not in done]
+    _set_job_status(job_id, status="running", total_clauses=len(checklist))
+
+    semaphore = asyncio.Semaphore(AUDIT_CONCURRENCY)
+
+    async def worker(clause):
+        async with semaphore:
+            try:
+                verdict = await run_in_threadpool(evaluate_clause, collection, convo_id, clause)
+                await run_in_threadpool(_save_result, job_id, clause, verdict)
+                return True
+            except Exception as e:
+                print(f"Audit {job_id}: clause {clause['clause_id']} failed: {e}")
+                return False
+
+    heartbeat = asyncio.create_task(_heartbeat(job_id))
+    try:
+        outcomes = await asyncio.gather(*(worker(c) for c in pending))
+    finally:
+        heartbeat.cancel()
+    failed = outcomes.count(False)
+    _set_job_status(
+        job_id,
+        status="failed" if failed else "completed",
+        failed_clauses=failed
+    )
@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine, MetaData, Table, Column, Integer, String, Text, ForeignKey
+from sqlalchemy import create_engine, MetaData, Table, Column, Integer, String, Text, LargeBinary, ForeignKey, UniqueConstraint, Index, inspect, text
 from sqlalchemy.orm import sessionmaker
 import os
 from dotenv import load_dotenv
@@ -27,6 +27,11 @@ conversations = Table(
     Column("id", String, primary_key=True),
     Column("user_id", Integer, ForeignKey("users.id")),
     Column("created_at", String),
+    # Maintained on every saved turn so listings never scan messages
+    Column("last_activity_at", String),
+    Column("message_count", Integer, default=0),
+    Index("ix_conversations_user_created", "user_id", "created_at", "id"),
+    Index("ix_conversations_user_activity", "user_id", "last_activity_at", "id"),
 )
 
 messages = Table(
@@ -37,10 +42,181 @@ messages = Table(
     Column("role", String),
     Column("content", Text),
     Column("timestamp", String),
+    # Serves history pages / last-N lookups as index range scans
+    Index("ix_messages_conversation_id", "conversation_id", "id"),
+    # Ids are never handed out again once deleted: archived messages keep theirs
+    # and history reads rely on ids growing across the hot and cold tiers
+    sqlite_autoincrement=True,
 )
 
+# Cold tier of `messages`: messages of idle conversations, compressed in blocks
+# of consecutive ids (see app/archive.py)
+message_archive = Table(
+    "message_archive",
+    metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("conversation_id", String, ForeignKey("conversations.id")),
+    Column("first_message_id", Integer),
+    Column("last_message_id", Integer),
+    Column("message_count", Integer),
+    Column("codec", String),  # zstd / zlib
+    Column("raw_bytes", Integer),
+    Column("compressed_bytes", Integer),
+    Column("payload", LargeBinary),
+    Column("created_at", String),
+    Index("ix_message_archive_conversation", "conversation_id", "first_message_id"),
+)
+
+audit_jobs = Table(
+    "audit_jobs",
+    metadata,
+    Column("id", String, primary_key=True),
+    Column("conversation_id", String, ForeignKey("conversations.id")),
+    Column("status", String),  # pending / running / completed / failed
+    Column("total_clauses", Integer),
+    Column("failed_clauses", Integer, default=0),
+    Column("created_at", String),
+    Column("updated_at", String),
+)
+
+# One row per evaluated clause: acts as the checkpoint a resumed job skips over
+audit_results = Table(
+    "audit_results",
+    metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("job_id", String, ForeignKey("audit_jobs.id")),
+    Column("clause_id", String),
+    Column("clause_title", String),
+    Column("status", String),  # conforming / partial / gap / not_applicable
+    Column("finding", Text),
+    Column("recommendation", Text),
+    Column("evidence", Text),  # JSON list of chunk ids
+    Column("created_at", String),
+    UniqueConstraint("job_id", "clause_id"),
+)
+
+# Near-duplicate detection (MinHash LSH), see app/dedup.py
+chunk_signatures = Table(
+    "chunk_signatures",
+    metadata,
+    Column("chunk_id", String, primary_key=True),
+    Column("scope", String),
+    Column("source", String),
+    Column("signature", LargeBinary),
+    Index("ix_chunk_signatures_scope_source", "scope", "source"),
+)
+
+lsh_buckets = Table(
+    "lsh_buckets",
+    metadata,
+    Column("band", Integer),
+    Column("bucket", String),
+    Column("chunk_id", String),
+    # Duplicates are only matched within a scope: lookups never leave it
+    Column("scope", String),
+    Index("ix_lsh_buckets_scope_band_bucket", "scope", "band", "bucket"),
+    Index("ix_lsh_buckets_chunk_id", "chunk_id"),
+)
+
+# Duplicate chunks that were not indexed, pointing at the chunk that represents them.
+# The text is kept so a duplicate can be promoted if its canonical chunk is deleted.
+chunk_links = Table(
+    "chunk_links",
+    metadata,
+    Column("chunk_id", String, primary_key=True),
+    Column("canonical_id", String),
+    Column("scope", String),
+    Column("source", String),
+    Column("content", Text),
+    Index("ix_chunk_links_canonical_id", "canonical_id"),
+    Index("ix_chunk_links_scope_source", "scope", "source"),
+)
+
+# Scopes of deleted conversations whose chunks are still to be purged, see app/retention.py
+orphan_scopes = Table(
+    "orphan_scopes",
+    metadata,
+    Column("scope", String, primary_key=True),
+    Column("queued_at", String),
+)
+
+def _migrate_conversation_metadata():
+    """
+    Adds the activity columns to databases created before they existed
+    and backfills them from the messages table (one-off).
+    """
+    columns = {c["name"] for c in inspect(engine).get_columns("conversations")}
+    if "last_activity_at" in columns and "message_count" in columns:
+        return
+    with engine.begin() as conn:
+        if "last_activity_at" not in columns:
+            conn.execute(text("ALTER TABLE conversations ADD COLUMN last_activity_at VARCHAR"))
+        if "message_count" not in columns:
+            conn.execute(text("ALTER TABLE conversations ADD COLUMN message_count INTEGER DEFAULT 0"))
+        conn.execute(text("""
+            UPDATE conversations SET
+                message_count = (SELECT COUNT(*) FROM messages WHERE messages.conversation_id = conversations.id),
+                last_activity_at = COALESCE(
+                    (SELECT MAX(timestamp) FROM messages WHERE messages.conversation_id = conversations.id),
+                    created_at
+                )
+        """))
+
+def _migrate_lsh_bucket_scope():
+    """
+    Adds the scope column to LSH buckets created before it existed and
+    backfills it from the chunk signatures (one-off).
+    """
+    columns = {c["name"] for c in inspect(engine).get_columns("lsh_buckets")}
+    if "scope" in columns:
+        return
+    with engine.begin() as conn:
+        conn.execute(text("ALTER TABLE lsh_buckets ADD COLUMN scope VARCHAR"))
+        conn.execute(text("""
+            UPDATE lsh_buckets SET scope = (
+                SELECT scope FROM chunk_signatures WHERE chunk_signatures.chunk_id = lsh_buckets.chunk_id
+            )
+        """))
+        conn.execute(text("DROP INDEX IF EXISTS ix_lsh_buckets_band_bucket"))
+
+def _migrate_messages_autoincrement():
+    """
+    SQLite databases created before `messages` used AUTOINCREMENT reuse the
+    largest id once its row is deleted. Rebuilds the table with AUTOINCREMENT
+    (one-off) and starts its sequence above every id already used, archive included.
+    """
+    if engine.dialect.name != "sqlite":
+        return
+    with engine.begin() as conn:
+        sql = conn.execute(text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'messages'")).scalar()
+        if not sql or "AUTOINCREMENT" in sql.upper():
+            return
+        conn.execute(text("DROP INDEX IF EXISTS ix_messages_conversation_id"))
+        conn.execute(text("ALTER TABLE messages RENAME TO messages_before_autoincrement"))
+        messages.create(bind=conn)
+        conn.execute(text("""
+            INSERT INTO messages (id, conversation_id, role, content, timestamp)
+            SELECT id, conversation_id, role, content, timestamp FROM messages_before_autoincrement
+        """))
+        conn.execute(text("DROP TABLE messages_before_autoincrement"))
+        high_water = conn.execute(text("""
+            SELECT MAX(seq) FROM (
+                SELECT MAX(id) AS seq FROM messages
+                UNION ALL SELECT MAX(last_message_id) FROM message_archive
+            )
+        """)).scalar() or 0
+        conn.execute(text("DELETE FROM sqlite_sequence WHERE name = 'messages'"))
+        conn.execute(text("INSERT INTO sqlite_sequence (name, seq) VALUES ('messages', :seq)"), {"seq": high_water})
+
 def init_db():
     metadata.create_all(bind=engine)
+    _migrate_conversation_metadata()
+    _migrate_lsh_bucket_scope()
+    _migrate_messages_autoincrement()
+    # create_all only builds indexes for new tables
+    for table in (conversations, messages, lsh_buckets):
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
 
 def get_db():
     """Yields a SQLAlchemy Database Connection (or Session)"""
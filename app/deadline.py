@@ -0,0 +1,31 @@
+import os
+import time
+
+# Total time an /ask request may take, and how it is split between stages.
+ASK_DEADLINE_SECONDS = float(os.getenv("ASK_DEADLINE_SECONDS", "30"))
+RETRIEVAL_SHARE = float(os.getenv("ASK_RETRIEVAL_SHARE", "0.25"))
+HISTORY_SHARE = float(os.getenv("ASK_HISTORY_SHARE", "0.05"))
+# Below this many seconds left for generation, the context is shrunk and the fast tier is used
+DEGRADE_BELOW_SECONDS = float(os.getenv("ASK_DEGRADE_BELOW_SECONDS", "10"))
+# Kept aside after generation to persist history and build the response
+RESERVE_SECONDS = 0.5
+
+
+class Deadline:
+    """
+    Time budget for one request. Stages ask for their slice with `stage()`,
+    which never exceeds what is actually left.
+    """
+
+    def __init__(self, budget: float = ASK_DEADLINE_SECONDS):
+        self.budget = budget
+        self.expires_at = time.monotonic() + budget
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def stage(self, share: float) -> float:
+        return min(self.remaining(), self.budget * share)
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
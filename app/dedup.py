@@ -0,0 +1,256 @@
+"""
+Near-duplicate chunk detection with MinHash + LSH.
+
+Every indexed chunk gets a MinHash signature, split into bands that are stored
+as LSH buckets of its scope in the relational DB (persistent across processes). A new chunk
+is a near duplicate when a chunk sharing one of its buckets, in the same scope,
+has an estimated Jaccard similarity >= DEDUP_THRESHOLD. Scopes are never
+deduplicated against each other: retrieval and audits filter on the scope, so
+a conversation chunk linked to a global one would never be found.
+
+DEDUP_MODE:
+    link (default)  duplicates are not indexed; they are recorded in chunk_links
+                    against their canonical chunk (and promoted if it is deleted)
+    skip            duplicates are dropped
+    off             no detection
+"""
+import base64
+import hashlib
+import os
+import re
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import and_, or_
+
+from app.database import chunk_signatures, lsh_buckets, chunk_links
+
+DEDUP_MODE = os.getenv("DEDUP_MODE", "link").lower()
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.9"))
+
+SHINGLE_WORDS = 5
+BANDS = 16
+ROWS = 8
+NUM_PERM = BANDS * ROWS
+
+_PRIME = (1 << 31) - 1
+# Fixed seed: signatures are persisted and must be identical in every process
+_rng = np.random.default_rng(9001)
+_A = _rng.integers(1, _PRIME, NUM_PERM, dtype=np.uint64)
+_B = _rng.integers(0, _PRIME, NUM_PERM, dtype=np.uint64)
+
+_SQL_BATCH = 500
+
+
+def _shingles(text: str) -> set:
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < SHINGLE_WORDS:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+
+
+def minhash(text: str) -> np.ndarray:
+    hashes = np.fromiter(
+        (int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "little") for s in _shingles(text)),
+        dtype=np.uint64
+    )
+    # (a * x + b) mod p for every permutation at once: a < 2^31 and x < 2^32 keep it within uint64
+    return ((np.outer(_A, hashes) + _B[:, None]) % _PRIME).min(axis=1).astype(np.uint32)
+
+
+def _bands(signature: np.ndarray) -> List[Tuple[int, str]]:
+    return [
+        (band, hashlib.blake2b(signature[band * ROWS:(band + 1) * ROWS].tobytes(), digest_size=8).hexdigest())
+        for band in range(BANDS)
+    ]
+
+
+def similarity(sig_a: np.ndarray, sig_b: np.ndarray) -> float:
+    """Estimated Jaccard similarity of the two shingle sets."""
+    return float(np.mean(sig_a == sig_b))
+
+
+def _find_canonical(db, scope: str, chunk_id: str, signature: np.ndarray, bands) -> str:
+    candidate_rows = db.execute(
+        lsh_buckets.select().with_only_columns(lsh_buckets.c.chunk_id).where(
+            (lsh_buckets.c.scope == scope)
+            & or_(*[and_(lsh_buckets.c.band == band, lsh_buckets.c.bucket == bucket) for band, bucket in bands])
+        )
+    ).fetchall()
+    candidates = {row.chunk_id for row in candidate_rows} - {chunk_id}
+    if not candidates:
+        return None
+
+    rows = []
+    candidates = list(candidates)
+    for i in range(0, len(candidates), _SQL_BATCH):
+        rows.extend(db.execute(
+            chunk_signatures.select().where(
+                chunk_signatures.c.chunk_id.in_(candidates[i:i + _SQL_BATCH]) & (chunk_signatures.c.scope == scope)
+            )
+        ).fetchall())
+    best_id, best_score = None, 0.0
+    for row in rows:
+        score = similarity(signature, np.frombuffer(row.signature, dtype=np.uint32))
+        if score > best_score:
+            best_id, best_score = row.chunk_id, score
+    return best_id if best_score >= DEDUP_THRESHOLD else None
+
+
+def filter_duplicates(db, scope: str, source: str, ids: List[str], chunks: List[str]):
+    """
+    Splits chunks into those to index and near duplicates of already indexed
+    chunks (including earlier chunks of the same batch).
+
+    Signatures of kept chunks are added to the session; the caller commits
+    once the chunks are actually in the vector store.
+
+    Returns (keep_ids, keep_chunks, duplicates) where duplicates is a list of
+    (chunk_id, canonical_id).
+    """
+    if DEDUP_MODE == "off":
+        return list(ids), list(chunks), []
+
+    keep_ids, keep_chunks, duplicates = [], [], []
+    for chunk_id, text in zip(ids, chunks):
+        signature = minhash(text)
+        bands = _bands(signature)
+        canonical = _find_canonical(db, scope, chunk_id, signature, bands)
+
+        if canonical:
+            duplicates.append((chunk_id, canonical))
+            if DEDUP_MODE == "link":
+                db.execute(chunk_links.delete().where(chunk_links.c.chunk_id == chunk_id))
+                db.execute(chunk_links.insert().values(
+                    chunk_id=chunk_id, canonical_id=canonical, scope=scope, source=source, content=text
+                ))
+            continue
+
+        db.execute(lsh_buckets.delete().where(lsh_buckets.c.chunk_id == chunk_id))
+        db.execute(chunk_signatures.delete().where(chunk_signatures.c.chunk_id == chunk_id))
+        db.execute(chunk_signatures.insert().values(
+            chunk_id=chunk_id, scope=scope, source=source, signature=signature.tobytes()
+        ))
+        db.execute(lsh_buckets.insert(), [
+            {"band": band, "bucket": bucket, "chunk_id": chunk_id, "scope": scope} for band, bucket in bands
+        ])
+        keep_ids.append(chunk_id)
+        keep_chunks.append(text)
+
+    return keep_ids, keep_chunks, duplicates
+
+
+def _delete_signatures(db, chunk_ids: List[str]):
+    for i in range(0, len(chunk_ids), _SQL_BATCH):
+        batch = chunk_ids[i:i + _SQL_BATCH]
+        db.execute(lsh_buckets.delete().where(lsh_buckets.c.chunk_id.in_(batch)))
+        db.execute(chunk_signatures.delete().where(chunk_signatures.c.chunk_id.in_(batch)))
+
+
+def forget_source(db, scope: str, source: str) -> List[dict]:
+    """
+    Drops the dedup state of one document (on delete or re-upload).
+
+    Duplicates in other documents that pointed at its chunks are re-checked:
+    those with no other canonical chunk are returned as
+    {"id", "document", "metadata"} and must be indexed by the caller.
+    """
+    removed = [row.chunk_id for row in db.execute(
+        chunk_signatures.select().with_only_columns(chunk_signatures.c.chunk_id).where(
+            (chunk_signatures.c.scope == scope) & (chunk_signatures.c.source == source)
+        )
+    ).fetchall()]
+    _delete_signatures(db, removed)
+    db.execute(chunk_links.delete().where((chunk_links.c.scope == scope) & (chunk_links.c.source == source)))
+
+    orphans = []
+    for i in range(0, len(removed), _SQL_BATCH):
+        orphans.extend(db.execute(
+            chunk_links.select().where(chunk_links.c.canonical_id.in_(removed[i:i + _SQL_BATCH]))
+        ).fetchall())
+    return _relink(db, orphans)
+
+
+def _relink(db, links) -> List[dict]:
+    """Drops `links` and re-checks their chunks; returns those that must be indexed."""
+    promoted = []
+    for orphan in links:
+        db.execute(chunk_links.delete().where(chunk_links.c.chunk_id == orphan.chunk_id))
+        keep_ids, keep_chunks, _ = filter_duplicates(db, orphan.scope, orphan.source, [orphan.chunk_id], [orphan.content])
+        if keep_ids:
+            promoted.append({
+                "id": orphan.chunk_id,
+                "document": orphan.content,
+                "metadata": {"source": orphan.source, "page": "auto", "scope": orphan.scope},
+            })
+    return promoted
+
+
+def promote_cross_scope_links(db, limit: int = _SQL_BATCH) -> List[dict]:
+    """
+    Resolves up to `limit` links to a canonical chunk of another scope, left
+    by versions that deduplicated conversation chunks against the global
+    scope. Returns the chunks to index, like forget_source().
+    """
+    links = db.execute(
+        chunk_links.select().select_from(
+            chunk_links.join(chunk_signatures, chunk_signatures.c.chunk_id == chunk_links.c.canonical_id)
+        ).where(chunk_signatures.c.scope != chunk_links.c.scope).limit(limit)
+    ).fetchall()
+    return _relink(db, links)
+
+
+def forget_scope(db, scope: str):
+    """Drops all dedup state of a conversation scope."""
+    removed = [row.chunk_id for row in db.execute(
+        chunk_signatures.select().with_only_columns(chunk_signatures.c.chunk_id).where(chunk_signatures.c.scope == scope)
+    ).fetchall()]
+    _delete_signatures(db, removed)
+    db.execute(chunk_links.delete().where(chunk_links.c.scope == scope))
+
+
+def iter_state(db, scope: Optional[str] = None) -> Iterator[dict]:
+    """
+    Dedup state of a scope (or of every scope) as JSON-able rows, for
+    snapshots: signatures (buckets are derived from them) and links.
+    """
+    signatures = chunk_signatures.select()
+    links = chunk_links.select()
+    if scope:
+        signatures = signatures.where(chunk_signatures.c.scope == scope)
+        links = links.where(chunk_links.c.scope == scope)
+    for row in db.execute(signatures.execution_options(yield_per=_SQL_BATCH)):
+        yield {
+            "kind": "signature", "chunk_id": row.chunk_id, "scope": row.scope, "source": row.source,
+            "signature": base64.b64encode(row.signature).decode("ascii"),
+        }
+    for row in db.execute(links.execution_options(yield_per=_SQL_BATCH)):
+        yield {
+            "kind": "link", "chunk_id": row.chunk_id, "canonical_id": row.canonical_id,
+            "scope": row.scope, "source": row.source, "content": row.content,
+        }
+
+
+def load_state(db, rows) -> dict:
+    """Loads rows from iter_state(), replacing the state of the same chunk ids. The caller commits."""
+    counts = {"signatures": 0, "links": 0}
+    for row in rows:
+        if row["kind"] == "signature":
+            signature = base64.b64decode(row["signature"])
+            _delete_signatures(db, [row["chunk_id"]])
+            db.execute(chunk_signatures.insert().values(
+                chunk_id=row["chunk_id"], scope=row["scope"], source=row["source"], signature=signature
+            ))
+            db.execute(lsh_buckets.insert(), [
+                {"band": band, "bucket": bucket, "chunk_id": row["chunk_id"], "scope": row["scope"]}
+                for band, bucket in _bands(np.frombuffer(signature, dtype=np.uint32))
+            ])
+            counts["signatures"] += 1
+        elif row["kind"] == "link":
+            db.execute(chunk_links.delete().where(chunk_links.c.chunk_id == row["chunk_id"]))
+            db.execute(chunk_links.insert().values(
+                chunk_id=row["chunk_id"], canonical_id=row["canonical_id"], scope=row["scope"],
+                source=row["source"], content=row["content"]
+            ))
+            counts["links"] += 1
+    return counts
@@ -0,0 +1,311 @@
+"""
+HNSW index maintenance for `iso_docs`.
+
+    # recall@k and latency of candidate settings vs brute-force exact search
+    python -m app.index_maintenance benchmark --m 16,32 --ef-construction 100,200 --ef-search 10,50,100
+
+    # deleted-entry fragmentation of the live index
+    python -m app.index_maintenance report
+
+    # rebuild (compacts deleted entries) with the chosen parameters
+    python -m app.index_maintenance rebuild --m 32 --ef-construction 200 --ef-search 50
+
+Works on the local store directly: stop the retrieval service / API workers
+before `rebuild`. Use the chosen values as HNSW_M / HNSW_EF_CONSTRUCTION /
+HNSW_EF_SEARCH so newly created collections get them too.
+"""
+import argparse
+import logging
+import sqlite3
+import struct
+import time
+from itertools import product
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import chromadb
+import numpy as np
+from chromadb.config import Settings
+
+from app.vectorstore import (
+    CHROMA_PATH, COLLECTION_NAME, get_chroma_client, get_embedding_function, hnsw_configuration
+)
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 1000
+
+
+def load_vectors(collection, limit: Optional[int] = None) -> Tuple[List[str], np.ndarray]:
+    ids, chunks, offset = [], [], 0
+    while limit is None or offset < limit:
+        size = BATCH_SIZE if limit is None else min(BATCH_SIZE, limit - offset)
+        batch = collection.get(include=["embeddings"], limit=size, offset=offset)
+        if not batch["ids"]:
+            break
+        ids.extend(batch["ids"])
+        chunks.append(np.asarray(batch["embeddings"], dtype=np.float32))
+        offset += len(batch["ids"])
+    return ids, (np.vstack(chunks) if chunks else np.zeros((0, 0), np.float32))
+
+
+def exact_top_k(data: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    """Brute-force squared-L2 top-k (row indices into `data`), best first."""
+    d2 = (queries ** 2).sum(1)[:, None] - 2 * queries @ data.T + (data ** 2).sum(1)[None, :]
+    top = np.argpartition(d2, kth=min(k, data.shape[0] - 1), axis=1)[:, :k]
+    order = np.take_along_axis(d2, top, axis=1).argsort(axis=1)
+    return np.take_along_axis(top, order, axis=1)
+
+
+def sample_queries(data: np.ndarray, n: int, noise: float, seed: int) -> np.ndarray:
+    """Stored vectors plus small noise: realistic neighbourhoods without exact self-hits."""
+    rng = np.random.default_rng(seed)
+    picks = rng.choice(data.shape[0], size=min(n, data.shape[0]), replace=False)
+    queries = data[picks] + rng.normal(0, noise, size=(len(picks), data.shape[1])).astype(np.float32)
+    return queries.astype(np.float32)
+
+
+def benchmark(data: np.ndarray, queries: np.ndarray, k: int, ms: List[int], efcs: List[int], efss: List[int]) -> List[dict]:
+    truth = exact_top_k(data, queries, k)
+    client = chromadb.EphemeralClient(settings=Settings(anonymized_telemetry=False))
+    rows = []
+
+    for m, efc, efs in product(ms, efcs, efss):
+        name = f"bench_m{m}_efc{efc}_efs{efs}"
+        col = client.create_collection(name, configuration=hnsw_configuration(m, efc, efs))
+
+        start = time.perf_counter()
+        for i in range(0, data.shape[0], BATCH_SIZE):
+            chunk = data[i:i + BATCH_SIZE]
+            col.add(ids=[str(j) for j in range(i, i + len(chunk))], embeddings=chunk)
+        build_seconds = time.perf_counter() - start
+
+        latencies, hits = [], 0
+        for qi, q in enumerate(queries):
+            t0 = time.perf_counter()
+            res = col.query(query_embeddings=[q], n_results=k, include=[])
+            latencies.append(time.perf_counter() - t0)
+            found = {int(x) for x in res["ids"][0]}
+            hits += len(found & set(truth[qi].tolist()))
+
+        latencies.sort()
+        rows.append({
+            "m": m, "ef_construction": efc, "ef_search": efs,
+            "recall": hits / (len(queries) * k),
+            "p50_ms": latencies[len(latencies) // 2] * 1000,
+            "p95_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000,
+            "build_s": build_seconds,
+        })
+        client.delete_collection(name)
+        logger.info(f"  M={m} ef_construction={efc} ef_search={efs}: recall@{k}={rows[-1]['recall']:.3f} p95={rows[-1]['p95_ms']:.2f}ms")
+    return rows
+
+
+def _vector_segment_dir(name: str = COLLECTION_NAME) -> Optional[Path]:
+    db_path = Path(CHROMA_PATH) / "chroma.sqlite3"
+    if not db_path.exists():
+        return None
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        row = conn.execute(
+            "SELECT s.id FROM segments s JOIN collections c ON s.collection = c.id "
+            "WHERE c.name = ? AND s.scope = 'VECTOR'", (name,)
+        ).fetchone()
+    finally:
+        conn.close()
+    if not row:
+        return None
+    path = Path(CHROMA_PATH) / row[0]
+    return path if path.exists() else None
+
+
+# Chroma's persisted hnswlib header: int32 format version, then offsetLevel0,
+# max_elements and cur_element_count (size_t each)
+HNSW_HEADER = struct.Struct("<iQQQ")
+HNSW_HEADER_VERSIONS = (1,)
+
+
+def _read_index_header(path: Path) -> Optional[Tuple[int, int]]:
+    """(max_elements, cur_element_count), or None when the layout is not the expected one."""
+    raw = path.read_bytes()[:HNSW_HEADER.size]
+    if len(raw) < HNSW_HEADER.size:
+        return None
+    version, _, max_elements, indexed = HNSW_HEADER.unpack(raw)
+    if version not in HNSW_HEADER_VERSIONS or indexed > max_elements:
+        logger.warning(f"⚠️ Unrecognized HNSW header in {path} (version={version}); fragmentation not reported")
+        return None
+    return max_elements, indexed
+
+
+def fragmentation_report(collection) -> dict:
+    """
+    hnswlib never removes deleted points: they stay in the graph (marked
+    deleted) until the index is rebuilt. Compares the element count in the
+    index header with the live count.
+    """
+    live = collection.count()
+    report = {"live_entries": live, "index_entries": None, "deleted_entries": None,
+              "fragmentation": None, "index_bytes": None, "reclaimable_bytes": None,
+              "sqlite_free_bytes": None}
+
+    segment = _vector_segment_dir()
+    header = segment / "header.bin" if segment else None
+    parsed = _read_index_header(header) if header and header.exists() else None
+    if parsed:
+        _, indexed = parsed
+        index_bytes = sum(f.stat().st_size for f in segment.iterdir() if f.is_file())
+        # Entries still in Chroma's write buffer are live but not yet in the graph
+        deleted = max(0, indexed - live)
+        ratio = deleted / indexed if indexed else 0.0
+        report.update({
+            "index_entries": indexed,
+            "deleted_entries": deleted,
+            "fragmentation": round(ratio, 4),
+            "index_bytes": index_bytes,
+            "reclaimable_bytes": int(index_bytes * ratio),
+        })
+
+    db_path = Path(CHROMA_PATH) / "chroma.sqlite3"
+    if db_path.exists():
+        conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+        try:
+            free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+            report["sqlite_free_bytes"] = free_pages * page_size
+        finally:
+            conn.close()
+    return report
+
+
+def rebuild(client, m: Optional[int], efc: Optional[int], efs: Optional[int], vacuum: bool = False) -> int:
+    """
+    Copies every entry (with its stored embedding) into a fresh collection
+    built with the given parameters, then swaps it in under the same name.
+    """
+    source = client.get_collection(COLLECTION_NAME)
+    tmp_name = f"{COLLECTION_NAME}__rebuild"
+    try:
+        client.delete_collection(tmp_name)
+    except Exception:
+        pass
+    target = client.create_collection(
+        tmp_name, configuration=hnsw_configuration(m, efc, efs), embedding_function=get_embedding_function()
+    )
+
+    copied, offset = 0, 0
+    while True:
+        batch = source.get(include=["documents", "metadatas", "embeddings"], limit=BATCH_SIZE, offset=offset)
+        if not batch["ids"]:
+            break
+        target.add(ids=batch["ids"], documents=batch["documents"], metadatas=batch["metadatas"],
+                   embeddings=batch["embeddings"])
+        copied += len(batch["ids"])
+        offset += len(batch["ids"])
+        logger.info(f"  copied {copied} entries")
+
+    if copied != source.count():
+        client.delete_collection(tmp_name)
+        raise RuntimeError("Collection changed during rebuild; stop writers and retry")
+
+    client.delete_collection(COLLECTION_NAME)
+    target.modify(name=COLLECTION_NAME)
+
+    if vacuum:
+        conn = sqlite3.connect(Path(CHROMA_PATH) / "chroma.sqlite3")
+        try:
+            conn.execute("VACUUM")
+        finally:
+            conn.close()
+    return copied
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+def _print_report(report: dict):
+    print(f"📄 Live entries:     {report['live_entries']}")
+    if report["index_entries"] is None:
+        print("   ⚠️ HNSW index header not found or not readable (empty collection, index not flushed yet, "
+              "or an unsupported chromadb version).")
+    else:
+        print(f"🧱 Index entries:    {report['index_entries']}")
+        print(f"🗑️  Deleted entries:  {report['deleted_entries']} ({report['fragmentation']:.1%})")
+        print(f"💾 Index size:       {report['index_bytes'] / (1024 * 1024):.1f} MiB "
+              f"(~{report['reclaimable_bytes'] / (1024 * 1024):.1f} MiB reclaimable by rebuild)")
+    if report["sqlite_free_bytes"] is not None:
+        print(f"🗄️  SQLite free pages: {report['sqlite_free_bytes'] / (1024 * 1024):.1f} MiB (rebuild --vacuum)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="HNSW tuning and compaction for iso_docs")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_bench = sub.add_parser("benchmark", help="Recall@k / latency of candidate HNSW settings")
+    p_bench.add_argument("--m", default="16,32")
+    p_bench.add_argument("--ef-construction", default="100,200")
+    p_bench.add_argument("--ef-search", default="10,50,100")
+    p_bench.add_argument("--k", type=int, default=5)
+    p_bench.add_argument("--queries", type=int, default=200)
+    p_bench.add_argument("--questions", help="Text file with one real question per line (used instead of sampled vectors)")
+    p_bench.add_argument("--max-docs", type=int, help="Only benchmark on the first N stored vectors")
+    p_bench.add_argument("--noise", type=float, default=0.01)
+    p_bench.add_argument("--target-recall", type=float, default=0.95)
+    p_bench.add_argument("--seed", type=int, default=0)
+
+    sub.add_parser("report", help="Fragmentation from deleted entries")
+
+    p_rebuild = sub.add_parser("rebuild", help="Rebuild / compact the collection")
+    p_rebuild.add_argument("--m", type=int)
+    p_rebuild.add_argument("--ef-construction", type=int)
+    p_rebuild.add_argument("--ef-search", type=int)
+    p_rebuild.add_argument("--vacuum", action="store_true", help="Also VACUUM chroma.sqlite3")
+
+    args = parser.parse_args(argv)
+    client = get_chroma_client()
+
+    if args.command == "report":
+        _print_report(fragmentation_report(client.get_collection(COLLECTION_NAME)))
+
+    elif args.command == "rebuild":
+        collection = client.get_collection(COLLECTION_NAME)
+        before = fragmentation_report(collection)
+        copied = rebuild(client, args.m, args.ef_construction, args.ef_search, vacuum=args.vacuum)
+        logger.info(f"🎯 Rebuilt {COLLECTION_NAME}: {copied} entries")
+        print("Before:")
+        _print_report(before)
+        print("After:")
+        _print_report(fragmentation_report(client.get_collection(COLLECTION_NAME)))
+
+    else:
+        _, data = load_vectors(client.get_collection(COLLECTION_NAME), limit=args.max_docs)
+        if data.shape[0] <= args.k:
+            logger.error("❌ Not enough vectors to benchmark")
+            return
+        if args.questions:
+            lines = [l.strip() for l in Path(args.questions).read_text(encoding="utf-8").splitlines() if l.strip()]
+            queries = np.asarray(get_embedding_function()(lines), dtype=np.float32)
+        else:
+            queries = sample_queries(data, args.queries, args.noise, args.seed)
+
+        logger.info(f"📐 Benchmarking on {data.shape[0]} vectors, {len(queries)} queries, k={args.k}")
+        rows = benchmark(data, queries, args.k, _int_list(args.m), _int_list(args.ef_construction), _int_list(args.ef_search))
+
+        print(f"\n{'M':>4} | {'ef_constr':>9} | {'ef_search':>9} | {'recall@' + str(args.k):>9} | {'p50 ms':>7} | {'p95 ms':>7} | {'build s':>7}")
+        print("-" * 72)
+        for r in rows:
+            print(f"{r['m']:>4} | {r['ef_construction']:>9} | {r['ef_search']:>9} | {r['recall']:>9.3f} | "
+                  f"{r['p50_ms']:>7.2f} | {r['p95_ms']:>7.2f} | {r['build_s']:>7.1f}")
+
+        eligible = [r for r in rows if r["recall"] >= args.target_recall]
+        if eligible:
+            best = min(eligible, key=lambda r: r["p95_ms"])
+            print(f"\n✅ Fastest setting with recall >= {args.target_recall}: "
+                  f"--m {best['m']} --ef-construction {best['ef_construction']} --ef-search {best['ef_search']}")
+        else:
+            print(f"\n⚠️ No setting reached recall {args.target_recall}; try larger M / ef values.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+from typing import List
+
+from app.dedup import filter_duplicates, forget_source
+from app.utils import generate_chunk_id
+
+
+def index_document(collection, db, scope: str, filename: str, chunks: List[str]) -> dict:
+    """
+    Upserts a document's chunks into the vector store, skipping near duplicates
+    of chunks already indexed in the same scope.
+
+    Dedup state is committed only after the upsert succeeded.
+    """
+    try:
+        # Re-upload: the previous version's chunks no longer count as canonical
+        promoted = forget_source(db, scope, filename)
+
+        ids = [generate_chunk_id(scope, filename, i) for i in range(len(chunks))]
+        keep_ids, keep_chunks, duplicates = filter_duplicates(db, scope, filename, ids, chunks)
+
+        upsert_ids = keep_ids + [p["id"] for p in promoted]
+        if upsert_ids:
+            collection.upsert(
+                documents=keep_chunks + [p["document"] for p in promoted],
+                metadatas=[{
+                    "source": filename,
+                    "page": "auto",
+                    "scope": scope
+                } for _ in keep_ids] + [p["metadata"] for p in promoted],
+                ids=upsert_ids
+            )
+        if duplicates:
+            # A previous upload may have indexed these ids before they became duplicates
+            collection.delete(ids=[chunk_id for chunk_id, _ in duplicates])
+
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    return {
+        "chunks_added": len(keep_ids),
+        "chunks_skipped": len(duplicates),
+        "dedup_ratio": round(len(duplicates) / len(chunks), 4) if chunks else 0.0,
+    }
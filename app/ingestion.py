@@ -1,23 +1,24 @@
-import chromadb
-from chromadb.config import Settings
 from pathlib import Path
 import logging
-import io
 from app.utils import process_file_stream
+from app.uploads import stage_file
+from app.vectorstore import get_chroma_collection
+from app.database import SessionLocal, init_db
+from app.indexing import index_document
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class IngestionISO:
     def __init__(self):
-        self.client = chromadb.PersistentClient(
-            path="./data/chroma_db",
-            settings=Settings(anonymized_telemetry=False)
-        )
-        self.collection = self.client.get_or_create_collection("iso_docs")
+        # Goes through the retrieval service when RETRIEVAL_SERVICE_URL is set,
+        # so ingestion can run next to live API workers
+        self.collection = get_chroma_collection()
     
     def run(self):
         """Pipeline complet d'ingestion"""
+        # Dedup signatures live in the relational DB
+        init_db()
         logger.info("📚 Ingestion des documents ISO...")
         
         # Extensions supported
@@ -29,37 +30,22 @@ class IngestionISO:
         for file_path in files:
             logger.info(f"  Processing: {file_path.name}")
             
-            with open(file_path, 'rb') as f:
-                # Load whole file into bytes for processing
-                file_bytes = io.BytesIO(f.read())
-                chunks = process_file_stream(file_bytes, file_path.name)
+            with open(file_path, 'rb') as f, stage_file(f, max_bytes=file_path.stat().st_size) as staged:
+                # Memory-mapped: the parsers read from the page cache, not from a copy
+                chunks = process_file_stream(staged.view, file_path.name)
             
-            # Add to Chromadb using Upsert and Standard IDs
-            chunks_to_add = []
-            metadatas = []
-            ids = []
+            # Add to Chromadb using Upsert and Standard IDs (global_filename_index),
+            # skipping near duplicates of chunks already in the global corpus
+            db = SessionLocal()
+            try:
+                result = index_document(self.collection, db, "global", file_path.name, chunks)
+            finally:
+                db.close()
             
-            for i, chunk in enumerate(chunks):
-                chunks_to_add.append(chunk)
-                metadatas.append({
-                    "source": file_path.name, 
-                    "page": "auto",
-                    "scope": "global"
-                })
-                # Use standard ID format: global_filename_index
-                # safe_filename logic is duplicated here slightly unless we import from utils
-                # relying on simple format for now or we should import generate_chunk_id
-                from app.utils import generate_chunk_id
-                ids.append(generate_chunk_id("global", file_path.name, i))
-
-            if chunks_to_add:
-                self.collection.upsert(
-                    documents=chunks_to_add,
-                    metadatas=metadatas,
-                    ids=ids
-                )
-            
-            logger.info(f"    ✅ {len(chunks)} chunks ajoutés")
+            logger.info(
+                f"    ✅ {result['chunks_added']} chunks ajoutés, "
+                f"{result['chunks_skipped']} doublons ignorés ({result['dedup_ratio']:.0%})"
+            )
         
         logger.info(f"🎯 Base prête: {self.collection.count()} documents")
 
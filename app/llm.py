@@ -1,6 +1,11 @@
 import os
+import asyncio
+import threading
+import time
 from abc import ABC, abstractmethod
-from typing import List, Dict, Any, Optional
+from collections import deque
+from typing import List, Dict, Any, Optional, Tuple
+from fastapi.concurrency import run_in_threadpool
 from groq import Groq
 import google.generativeai as genai
 
@@ -9,11 +14,18 @@ class LLMClient(ABC):
     def generate_answer(self, system_prompt: str, history: List[Dict[str, str]], question: str, model: Optional[str] = None) -> str:
         pass
 
+    async def agenerate_answer(self, system_prompt: str, history: List[Dict[str, str]], question: str, model: Optional[str] = None) -> str:
+        # SDK calls are blocking: keep them off the event loop
+        return await run_in_threadpool(self.generate_answer, system_prompt, history, question, model=model)
+
 class GroqClient(LLMClient):
+    provider = "groq"
+
     def __init__(self):
         api_key = os.getenv("GROQ_API_KEY")
         if not api_key:
             raise ValueError("GROQ_API_KEY not set")
+        # The SDK keeps an HTTP connection pool, so one instance is shared by all requests
         self.client = Groq(api_key=api_key)
         self.default_model = "llama-3.3-70b-versatile"
 
@@ -24,7 +36,7 @@ class GroqClient(LLMClient):
         messages.append({"role": "user", "content": question})
 
         target_model = model if model else self.default_model
-        
+
         completion = self.client.chat.completions.create(
             messages=messages,
             model=target_model,
@@ -32,6 +44,8 @@ class GroqClient(LLMClient):
         return completion.choices[0].message.content
 
 class GeminiClient(LLMClient):
+    provider = "gemini"
+
     def __init__(self):
         api_key = os.getenv("GEMINI_API_KEY")
         if not api_key:
@@ -39,31 +53,286 @@ class GeminiClient(LLMClient):
             print("WARNING: GEMINI_API_KEY not set")
         else:
             genai.configure(api_key=api_key)
-        self.default_model = "gemini-pro"
+        self.default_model = os.getenv("GEMINI_MODEL", "gemini-pro")
+        # GenerativeModel instances are reusable: build one per model name
+        self._models: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def _get_model(self, name: str):
+        with self._lock:
+            if name not in self._models:
+                self._models[name] = genai.GenerativeModel(name)
+            return self._models[name]
 
     def generate_answer(self, system_prompt: str, history: List[Dict[str, str]], question: str, model: Optional[str] = None) -> str:
-        # Gemini handles history strictly. We'll simplify by combining context into prompt for now, 
-        # or use start_chat. For RAG, single-turn with context is often easier in Gemini APIs 
+        # Gemini handles history strictly. We'll simplify by combining context into prompt for now,
+        # or use start_chat. For RAG, single-turn with context is often easier in Gemini APIs
         # unless using the chat session object.
         # Let's map messages to Gemini format: user/model.
-        
+
         # Note: System prompt in Gemini is often just prepended to the first message or configured.
         # For simplicity in this generic wrapper:
-        
+
         full_prompt = f"System Instruction:\n{system_prompt}\n\nHistory:\n"
         for msg in history:
             role = "User" if msg['role'] == 'user' else "Model"
             full_prompt += f"{role}: {msg['content']}\n"
-        
+
         full_prompt += f"\nUser: {question}"
 
-        target_model = "gemini-pro" # Gemini has fewer model aliases
-        model_instance = genai.GenerativeModel(target_model)
-        response = model_instance.generate_content(full_prompt)
+        target_model = model if model else self.default_model
+        response = self._get_model(target_model).generate_content(full_prompt)
         return response.text
 
+PROVIDERS = {
+    "groq": GroqClient,
+    "gemini": GeminiClient,
+}
+
+def provider_for_model(model: Optional[str]) -> Optional[str]:
+    """Guesses which provider serves a model name (None when no model is requested)."""
+    if not model:
+        return None
+    return "gemini" if model.lower().startswith("gemini") else "groq"
+
+class BackendStats:
+    """Rolling latency / error window for one (provider, model) backend."""
+
+    WINDOW = 50
+    MIN_SAMPLES = 10
+    MAX_ERROR_RATE = 0.5
+    COOLDOWN_SECONDS = 30.0
+
+    def __init__(self):
+        self.latencies = deque(maxlen=self.WINDOW)
+        self.outcomes = deque(maxlen=self.WINDOW)
+        self.consecutive_failures = 0
+        self.last_failure = 0.0
+        self.last_probe = 0.0
+        self.probing = False
+        self.requests = 0
+        self.hedges = 0
+        self._lock = threading.Lock()
+
+    def record(self, latency: float, ok: bool):
+        with self._lock:
+            self.requests += 1
+            self.outcomes.append(ok)
+            if ok:
+                self.latencies.append(latency)
+                self.consecutive_failures = 0
+                if self.probing:
+                    # The backend recovered: its old failures no longer count
+                    self.outcomes.clear()
+                    self.outcomes.append(True)
+            else:
+                self.consecutive_failures += 1
+                self.last_failure = time.monotonic()
+            self.probing = False
+
+    def error_rate(self) -> float:
+        return self.outcomes.count(False) / len(self.outcomes) if self.outcomes else 0.0
+
+    def healthy(self) -> bool:
+        if self.consecutive_failures >= 3 and time.monotonic() - self.last_failure < self.COOLDOWN_SECONDS:
+            return False
+        return len(self.outcomes) < self.MIN_SAMPLES or self.error_rate() <= self.MAX_ERROR_RATE
+
+    def probe_due(self) -> bool:
+        """
+        Half-open: an unhealthy backend is only measured when it is called, so
+        it gets one trial call per COOLDOWN_SECONDS. Claims the probe when due.
+        """
+        if self.healthy():
+            return False
+        with self._lock:
+            now = time.monotonic()
+            if now - max(self.last_failure, self.last_probe) < self.COOLDOWN_SECONDS:
+                return False
+            self.last_probe = now
+            self.probing = True
+            return True
+
+    def mean_latency(self) -> float:
+        return sum(self.latencies) / len(self.latencies) if self.latencies else 0.0
+
+    def p95(self) -> Optional[float]:
+        if len(self.latencies) < self.MIN_SAMPLES:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+    def snapshot(self) -> dict:
+        p95 = self.p95()
+        return {
+            "requests": self.requests,
+            "hedges": self.hedges,
+            "healthy": self.healthy(),
+            "error_rate": round(self.error_rate(), 4),
+            "mean_latency": round(self.mean_latency(), 4),
+            "p95_latency": round(p95, 4) if p95 is not None else None,
+        }
+
+class LLMRouter(LLMClient):
+    """
+    Routes generations across the configured providers.
+
+    - One long-lived client per provider (pooled connections, cached models).
+    - A requested model is served by its own provider; otherwise backends
+      are ranked by health, then by rolling mean latency.
+    - Failover: a failed call moves on to the next backend. A backend ranked
+      unhealthy is retried once per cooldown (half-open probe).
+    - Hedging (async path): if the primary has not answered by its p95
+      latency, a second backend is raced against it and the loser is cancelled.
+      With a single backend, the hedge is a new call to that backend.
+    """
+
+    def __init__(self, clients: Dict[str, LLMClient]):
+        if not clients:
+            raise ValueError("No LLM provider configured")
+        self.clients = clients
+        self.order = list(clients)
+        self.stats: Dict[Tuple[str, str], BackendStats] = {}
+        self.hedge_delay = float(os.getenv("LLM_HEDGE_DELAY", "8"))
+        self._lock = threading.Lock()
+
+    def _stats(self, backend: Tuple[str, str]) -> BackendStats:
+        with self._lock:
+            if backend not in self.stats:
+                self.stats[backend] = BackendStats()
+            return self.stats[backend]
+
+    def _candidates(self, model: Optional[str]) -> List[Tuple[str, str]]:
+        """
+        (provider, model) pairs, best first. A requested model (explicit or
+        tiered) is always tried first on its own provider; the other providers,
+        with their default model, only serve as failover and hedge targets.
+        """
+        requested_provider = provider_for_model(model)
+        pinned = None
+        backends = []
+        for provider in self.order:
+            if provider == requested_provider:
+                pinned = (provider, model)
+            else:
+                backends.append((provider, self.clients[provider].default_model))
+
+        def rank(item):
+            i, backend = item
+            st = self._stats(backend)
+            # A due probe goes first so that it is actually sent (the caller fails over if it fails)
+            state = 0 if st.probe_due() else 1 if st.healthy() else 2
+            # Unmeasured backends sort as 0s so they get explored once
+            return (state, st.mean_latency(), i)
+
+        ranked = [b for _, b in sorted(enumerate(backends), key=rank)]
+        return [pinned] + ranked if pinned else ranked
+
+    def _call(self, backend: Tuple[str, str], system_prompt, history, question) -> str:
+        provider, model = backend
+        start = time.monotonic()
+        try:
+            answer = self.clients[provider].generate_answer(system_prompt, history, question, model=model)
+        except Exception:
+            self._stats(backend).record(time.monotonic() - start, False)
+            raise
+        self._stats(backend).record(time.monotonic() - start, True)
+        return answer
+
+    def generate_answer(self, system_prompt: str, history: List[Dict[str, str]], question: str, model: Optional[str] = None) -> str:
+        last_error = None
+        for backend in self._candidates(model):
+            try:
+                return self._call(backend, system_prompt, history, question)
+            except Exception as e:
+                print(f"LLM backend {backend[0]}/{backend[1]} failed: {e}")
+                last_error = e
+        raise last_error
+
+    async def agenerate_answer(self, system_prompt: str, history: List[Dict[str, str]], question: str, model: Optional[str] = None) -> str:
+        candidates = self._candidates(model)
+        pending: Dict[asyncio.Task, Tuple[str, str]] = {}
+        last_error = None
+        # With a single backend, the hedge is a second call to that same backend
+        same_backend_hedge = len(candidates) == 1
+
+        def launch(backend):
+            task = asyncio.ensure_future(
+                run_in_threadpool(self._call, backend, system_prompt, history, question)
+            )
+            pending[task] = backend
+
+        try:
+            launch(candidates.pop(0))
+            while pending:
+                # Hedge only while one request is outstanding and a hedge target is left
+                timeout = None
+                if len(pending) == 1 and (candidates or same_backend_hedge):
+                    timeout = self._stats(next(iter(pending.values()))).p95() or self.hedge_delay
+
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    if candidates:
+                        backend = candidates.pop(0)
+                    else:
+                        backend = next(iter(pending.values()))
+                        same_backend_hedge = False
+                    self._stats(backend).hedges += 1
+                    launch(backend)
+                    continue
+
+                for task in done:
+                    provider, target = pending.pop(task)
+                    if task.exception() is None:
+                        return task.result()
+                    last_error = task.exception()
+                    print(f"LLM backend {provider}/{target} failed: {last_error}")
+
+                # Failover: nothing left racing, try the next backend
+                if not pending and candidates:
+                    launch(candidates.pop(0))
+        finally:
+            # Cancel the loser. The SDK call already running in its worker thread
+            # cannot be interrupted; its result is simply discarded.
+            for task in pending:
+                task.cancel()
+
+        raise last_error
+
+    def snapshot(self) -> dict:
+        return {f"{provider}/{model}": st.snapshot() for (provider, model), st in self.stats.items()}
+
+_router: Optional[LLMRouter] = None
+_router_lock = threading.Lock()
+
+def _configured_providers() -> List[str]:
+    """
+    LLM_PROVIDERS lists backends in preference order (e.g. "groq,gemini").
+    Otherwise LLM_PROVIDER is the primary and any other provider with an
+    API key set is added as a failover.
+    """
+    explicit = os.getenv("LLM_PROVIDERS")
+    if explicit:
+        return [p.strip().lower() for p in explicit.split(",") if p.strip().lower() in PROVIDERS]
+
+    primary = os.getenv("LLM_PROVIDER", "groq").lower()
+    providers = [primary if primary in PROVIDERS else "groq"]
+    for name, env_key in (("groq", "GROQ_API_KEY"), ("gemini", "GEMINI_API_KEY")):
+        if name not in providers and os.getenv(env_key):
+            providers.append(name)
+    return providers
+
 def get_llm_client() -> LLMClient:
-    provider = os.getenv("LLM_PROVIDER", "groq").lower()
-    if provider == "gemini":
-        return GeminiClient()
-    return GroqClient()
+    """Returns the process-wide router (clients are created once and reused)."""
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                clients = {}
+                for name in _configured_providers():
+                    try:
+                        clients[name] = PROVIDERS[name]()
+                    except ValueError as e:
+                        print(f"WARNING: LLM provider {name} disabled: {e}")
+                _router = LLMRouter(clients)
+    return _router
@@ -1,13 +1,23 @@
 from fastapi import FastAPI
 from starlette.middleware.cors import CORSMiddleware
-from app.api import conversations, auth
+from app.api import conversations, auth, audits, metrics
 from app.database import init_db
+from app.uploads import UploadLimitMiddleware
+from app.retention import retention_sweeper
+from app.responses import FastJSONResponse, CompressionMiddleware
 
-app = FastAPI(title="ISO 9001 RAG Chatbot")
+# orjson rendering by default (see app/responses.py)
+app = FastAPI(title="ISO 9001 RAG Chatbot", default_response_class=FastJSONResponse)
 
 # Initialize DB
 init_db()
 
+# The last middleware added is the outermost one.
+# brotli/gzip for JSON bodies over COMPRESS_MIN_BYTES
+app.add_middleware(CompressionMiddleware)
+# Rejects oversized uploads before their body is spooled
+app.add_middleware(UploadLimitMiddleware)
+# Outermost, so that responses produced by the middlewares above (413) carry CORS headers too
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -18,6 +28,17 @@ app.add_middleware(
 
 app.include_router(auth.router, prefix="/api/v1/auth", tags=["auth"])
 app.include_router(conversations.router, prefix="/api/v1/conversations", tags=["conversations"])
+app.include_router(audits.router, prefix="/api/v1/conversations", tags=["audits"])
+app.include_router(metrics.router, prefix="/api/v1/metrics", tags=["metrics"])
+
+@app.on_event("startup")
+async def start_retention_sweeper():
+    # Idle conversations and orphaned chunks are collected in the background
+    retention_sweeper.start()
+
+@app.on_event("shutdown")
+async def stop_retention_sweeper():
+    await retention_sweeper.stop()
 
 @app.get("/")
 def health_check():
@@ -0,0 +1,131 @@
+import os
+import re
+import threading
+import time
+from collections import deque
+from typing import List, Dict, Optional, Tuple
+
+from app.llm import LLMClient
+
+FAST_MODEL = os.getenv("LLM_FAST_MODEL", "llama-3.1-8b-instant")
+STRONG_MODEL = os.getenv("LLM_STRONG_MODEL", "llama-3.3-70b-versatile")
+
+# Thresholds (tunable from the per-tier stats exposed on /metrics)
+MAX_FAST_WORDS = int(os.getenv("TIER_MAX_FAST_WORDS", "25"))
+MAX_FAST_HISTORY = int(os.getenv("TIER_MAX_FAST_HISTORY", "2"))
+# Chroma returns squared L2 distances: lower is closer
+MAX_FAST_DISTANCE = float(os.getenv("TIER_MAX_FAST_DISTANCE", "0.9"))
+MIN_FAST_SPREAD = float(os.getenv("TIER_MIN_FAST_SPREAD", "0.15"))
+# Fast answers shorter than this are considered failed and escalated
+MIN_FAST_ANSWER_CHARS = int(os.getenv("TIER_MIN_FAST_ANSWER_CHARS", "20"))
+
+CLAUSE_LOOKUP = re.compile(
+    r"\b(what|which)\b.*\b(clause|section|chapter)?\s*\d{1,2}(\.\d{1,2}){1,3}\b"
+    r"|\b(clause|section|chapter)\s+\d{1,2}(\.\d{1,2}){0,3}\b",
+    re.IGNORECASE
+)
+COMPLEX_HINTS = re.compile(
+    r"\b(compare|comparison|difference|evaluate|assess|audit|gap|analy[sz]e|why|justify|draft|write|plan|improve)\b",
+    re.IGNORECASE
+)
+
+class TierStats:
+    def __init__(self):
+        self.requests = 0
+        self.escalations = 0
+        self.latencies = deque(maxlen=200)
+        self.reasons: Dict[str, int] = {}
+
+    def snapshot(self) -> dict:
+        ordered = sorted(self.latencies)
+        return {
+            "requests": self.requests,
+            "escalations": self.escalations,
+            "mean_latency": round(sum(ordered) / len(ordered), 4) if ordered else None,
+            "p95_latency": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 4) if ordered else None,
+            "reasons": dict(self.reasons),
+        }
+
+class ModelTierPolicy:
+    """
+    Sends each request to a fast or strong model tier based on cheap signals:
+    question length, clause-lookup phrasing, history length and how clearly
+    retrieval separated the best chunk from the rest.
+    """
+
+    def __init__(self, fast_model: str = FAST_MODEL, strong_model: str = STRONG_MODEL):
+        self.models = {"fast": fast_model, "strong": strong_model, "explicit": None}
+        self.stats = {tier: TierStats() for tier in self.models}
+        self._lock = threading.Lock()
+
+    def classify(self, question: str, distances: List[float], history_len: int) -> Tuple[str, str]:
+        """Returns (tier, reason)."""
+        words = len(question.split())
+        if CLAUSE_LOOKUP.search(question) and words <= MAX_FAST_WORDS * 2 and not COMPLEX_HINTS.search(question):
+            return "fast", "clause_lookup"
+        if words > MAX_FAST_WORDS:
+            return "strong", "long_question"
+        if COMPLEX_HINTS.search(question):
+            return "strong", "complex_intent"
+        if history_len > MAX_FAST_HISTORY:
+            return "strong", "long_history"
+        if not distances:
+            return "strong", "no_context"
+        ordered = sorted(distances)
+        if ordered[0] > MAX_FAST_DISTANCE:
+            return "strong", "weak_retrieval"
+        if len(ordered) > 1 and ordered[-1] - ordered[0] < MIN_FAST_SPREAD:
+            # Many equally relevant chunks: the answer needs synthesis
+            return "strong", "flat_retrieval"
+        return "fast", "simple"
+
+    def select(self, question: str, distances: List[float], history_len: int, explicit_model: Optional[str] = None) -> Tuple[str, Optional[str]]:
+        """Returns (tier, model). An explicitly requested model always wins."""
+        if explicit_model:
+            tier, reason, model = "explicit", "requested", explicit_model
+        else:
+            tier, reason = self.classify(question, distances, history_len)
+            model = self.models[tier]
+        with self._lock:
+            st = self.stats[tier]
+            st.reasons[reason] = st.reasons.get(reason, 0) + 1
+        return tier, model
+
+    async def agenerate_answer(self, client: LLMClient, tier: str, system_prompt: str, history: List[Dict[str, str]], question: str, model: Optional[str] = None) -> str:
+        """Generates on the selected tier; a failed or empty fast answer escalates to the strong tier."""
+        start = time.monotonic()
+        st = self.stats[tier]
+        st.requests += 1
+        try:
+            answer = await client.agenerate_answer(system_prompt, history, question, model=model)
+            if tier != "fast" or len((answer or "").strip()) >= MIN_FAST_ANSWER_CHARS:
+                return answer
+        except Exception as e:
+            if tier != "fast":
+                raise
+            print(f"Fast tier failed, escalating: {e}")
+        finally:
+            st.latencies.append(time.monotonic() - start)
+
+        st.escalations += 1
+        strong = self.stats["strong"]
+        strong.requests += 1
+        start = time.monotonic()
+        try:
+            return await client.agenerate_answer(system_prompt, history, question, model=self.models["strong"])
+        finally:
+            strong.latencies.append(time.monotonic() - start)
+
+    def snapshot(self) -> dict:
+        return {
+            "models": {k: v for k, v in self.models.items() if v},
+            "thresholds": {
+                "max_fast_words": MAX_FAST_WORDS,
+                "max_fast_history": MAX_FAST_HISTORY,
+                "max_fast_distance": MAX_FAST_DISTANCE,
+                "min_fast_spread": MIN_FAST_SPREAD,
+            },
+            "tiers": {tier: st.snapshot() for tier, st in self.stats.items()},
+        }
+
+tier_policy = ModelTierPolicy()
@@ -0,0 +1,354 @@
+"""
+Conversation deletion and garbage collection of per-conversation chunks.
+
+Chunks uploaded to a conversation live in `iso_docs` under scope=<convo_id>.
+Deleting a conversation removes its rows (messages, audits, dedup state),
+records its scope in `orphan_scopes`, then deletes its chunks by id in
+batches rather than with a metadata-filtered delete. The record is dropped
+once the chunks are gone.
+
+A background sweeper enforces the retention policy:
+- conversations idle for more than RETENTION_IDLE_DAYS are deleted (0: never);
+- messages of conversations idle for more than ARCHIVE_IDLE_DAYS are moved
+  to the compressed archive (app/archive.py);
+- scopes with no live conversation are removed in batches. Candidates come
+  from the database: `orphan_scopes` (expired conversations, deletions whose
+  vector cleanup failed) and dedup state left without a conversation. Only
+  `--full-scan` walks the vector store, for orphans older than
+  `orphan_scopes`;
+- conversation chunks that older versions linked to a global duplicate
+  instead of indexing them are indexed (app/dedup.py).
+
+Each sweep reports the reclaimed chunks and (estimated) bytes. With several
+API workers only one sweeps at a time (file lock).
+
+    python -m app.retention sweep [--full-scan]
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from datetime import datetime, timedelta
+from typing import List, Optional, Set
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import func
+
+from app.database import (
+    SessionLocal, conversations, messages, audit_jobs, audit_results, chunk_signatures, chunk_links, orphan_scopes
+)
+from app.dedup import forget_scope, promote_cross_scope_links
+from app.archive import compact, delete_archive, ARCHIVE_IDLE_DAYS
+from app.audit import active_job_filter
+from app.working_set import working_set
+
+RETENTION_IDLE_DAYS = float(os.getenv("RETENTION_IDLE_DAYS", "0"))
+# Seconds between background sweeps (0 disables the sweeper)
+RETENTION_SWEEP_INTERVAL = float(os.getenv("RETENTION_SWEEP_INTERVAL", "3600"))
+# Chunks fetched/deleted per call, and conversations expired per sweep
+RETENTION_BATCH = int(os.getenv("RETENTION_BATCH", "500"))
+RETENTION_LOCK_FILE = os.getenv("RETENTION_LOCK_FILE", "./data/retention.lock")
+
+GLOBAL_SCOPE = "global"
+
+
+def _chunk_bytes(batch: dict, dim: int) -> int:
+    """Approximate storage of a batch of chunks: text, metadata and `dim` float32 values each."""
+    size = sum(len(doc.encode("utf-8")) for doc in batch.get("documents") or [] if doc)
+    size += sum(len(json.dumps(m)) for m in batch.get("metadatas") or [] if m)
+    return size + len(batch["ids"]) * dim * 4
+
+
+def _embedding_dim(collection, chunk_id: str) -> int:
+    embeddings = collection.get(ids=[chunk_id], include=["embeddings"]).get("embeddings")
+    return len(embeddings[0]) if embeddings is not None and len(embeddings) else 0
+
+
+def purge_scope(collection, scope: str, batch_size: int = RETENTION_BATCH) -> dict:
+    """Deletes every chunk of a scope. Returns {"chunks", "bytes"}."""
+    if scope == GLOBAL_SCOPE:
+        raise ValueError("The global scope is never purged")
+    chunks, size, dim = 0, 0, None
+    while True:
+        # Vectors are not fetched: they are about to be deleted, only their size is counted
+        batch = collection.get(where={"scope": scope}, limit=batch_size, include=["documents", "metadatas"])
+        ids = batch["ids"]
+        if not ids:
+            break
+        if dim is None:
+            dim = _embedding_dim(collection, ids[0])
+        size += _chunk_bytes(batch, dim)
+        collection.delete(ids=ids)
+        chunks += len(ids)
+    return {"chunks": chunks, "bytes": size}
+
+
+def delete_conversation_rows(db, convo_id: str):
+    """Deletes a conversation and everything that references it. The caller commits."""
+    job_ids = db.execute(
+        audit_jobs.select().with_only_columns(audit_jobs.c.id).where(audit_jobs.c.conversation_id == convo_id)
+    ).scalars().all()
+    if job_ids:
+        db.execute(audit_results.delete().where(audit_results.c.job_id.in_(job_ids)))
+        db.execute(audit_jobs.delete().where(audit_jobs.c.id.in_(job_ids)))
+    db.execute(messages.delete().where(messages.c.conversation_id == convo_id))
+    delete_archive(db, convo_id)
+    forget_scope(db, convo_id)
+    db.execute(conversations.delete().where(conversations.c.id == convo_id))
+    # Kept until the chunks are purged
+    db.execute(orphan_scopes.delete().where(orphan_scopes.c.scope == convo_id))
+    db.execute(orphan_scopes.insert().values(scope=convo_id, queued_at=datetime.utcnow().isoformat()))
+
+
+def delete_conversation(db, collection, convo_id: str) -> dict:
+    """
+    Deletes a conversation, then its chunks. Rows go first: if the vector
+    cleanup fails, the scope stays in orphan_scopes for the next sweep.
+    """
+    try:
+        delete_conversation_rows(db, convo_id)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    working_set.invalidate(convo_id)
+
+    try:
+        reclaimed = purge_scope(collection, convo_id)
+    except Exception as e:
+        print(f"Chunks of conversation {convo_id} left to the retention sweep: {e}")
+        return {"chunks": 0, "bytes": 0}
+    _forget_orphan(db, convo_id)
+    return reclaimed
+
+
+def _forget_orphan(db, scope: str):
+    db.execute(orphan_scopes.delete().where(orphan_scopes.c.scope == scope))
+    db.commit()
+
+
+def expire_idle_conversations(db, idle_days: float, limit: int = RETENTION_BATCH) -> List[str]:
+    """Deletes up to `limit` conversations idle for more than `idle_days` (their chunks become orphans)."""
+    cutoff = (datetime.utcnow() - timedelta(days=idle_days)).isoformat()
+    last_activity = func.coalesce(conversations.c.last_activity_at, conversations.c.created_at)
+    running = audit_jobs.select().with_only_columns(audit_jobs.c.conversation_id).where(active_job_filter())
+    expired = db.execute(
+        conversations.select().with_only_columns(conversations.c.id).where(
+            (last_activity < cutoff) & conversations.c.id.not_in(running)
+        ).limit(limit)
+    ).scalars().all()
+    for convo_id in expired:
+        delete_conversation_rows(db, convo_id)
+        working_set.invalidate(convo_id)
+    db.commit()
+    return expired
+
+
+def _live_scopes(db) -> Set[str]:
+    return set(db.execute(conversations.select().with_only_columns(conversations.c.id)).scalars().all())
+
+
+def _scan_scopes(collection, page_size: int) -> Set[str]:
+    """Every conversation scope in the vector store (metadata scan, page by page)."""
+    scopes, offset = set(), 0
+    while True:
+        page = collection.get(
+            where={"scope": {"$ne": GLOBAL_SCOPE}}, include=["metadatas"], limit=page_size, offset=offset
+        )
+        if not page["ids"]:
+            break
+        scopes.update(m.get("scope") for m in page["metadatas"] or [] if m)
+        offset += len(page["ids"])
+    scopes.discard(None)
+    return scopes
+
+
+def find_orphan_scopes(db, collection, full_scan: bool = False, page_size: int = RETENTION_BATCH) -> Set[str]:
+    """
+    Scopes with no conversation: those queued in orphan_scopes or left in the
+    dedup state. `full_scan` also walks the whole vector store.
+    """
+    scopes = set(db.execute(orphan_scopes.select().with_only_columns(orphan_scopes.c.scope)).scalars())
+    scopes |= set(db.execute(chunk_signatures.select().with_only_columns(chunk_signatures.c.scope).distinct()).scalars())
+    scopes |= set(db.execute(chunk_links.select().with_only_columns(chunk_links.c.scope).distinct()).scalars())
+    if full_scan:
+        scopes |= _scan_scopes(collection, page_size)
+    scopes.discard(GLOBAL_SCOPE)
+    return scopes - _live_scopes(db)
+
+
+def sweep(collection=None, idle_days: float = RETENTION_IDLE_DAYS, full_scan: bool = False) -> dict:
+    """One retention pass. Returns the report."""
+    if collection is None:
+        from app.vectorstore import get_chroma_collection
+        collection = get_chroma_collection()
+
+    started = time.monotonic()
+    report = {
+        "finished_at": None,
+        "conversations_expired": 0,
+        "messages_archived": 0,
+        "scopes_removed": 0,
+        "chunks_removed": 0,
+        "bytes_reclaimed": 0,
+        "chunks_promoted": 0,
+        "duration": 0.0,
+    }
+    db = SessionLocal()
+    try:
+        if idle_days > 0:
+            report["conversations_expired"] = len(expire_idle_conversations(db, idle_days))
+        if ARCHIVE_IDLE_DAYS > 0:
+            # Keeps the hot messages table down to recently active conversations
+            report["messages_archived"] = compact(db, idle_days=ARCHIVE_IDLE_DAYS)["messages"]
+
+        for scope in find_orphan_scopes(db, collection, full_scan=full_scan):
+            reclaimed = purge_scope(collection, scope)
+            forget_scope(db, scope)
+            _forget_orphan(db, scope)
+            if reclaimed["chunks"]:
+                report["scopes_removed"] += 1
+            report["chunks_removed"] += reclaimed["chunks"]
+            report["bytes_reclaimed"] += reclaimed["bytes"]
+
+        promoted = promote_cross_scope_links(db, limit=RETENTION_BATCH)
+        if promoted:
+            collection.upsert(
+                ids=[p["id"] for p in promoted],
+                documents=[p["document"] for p in promoted],
+                metadatas=[p["metadata"] for p in promoted],
+            )
+        # Links are dropped only once their chunks are indexed
+        db.commit()
+        report["chunks_promoted"] = len(promoted)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+    report["finished_at"] = datetime.utcnow().isoformat()
+    report["duration"] = round(time.monotonic() - started, 3)
+    return report
+
+
+def _try_lock():
+    """Non-blocking exclusive lock on RETENTION_LOCK_FILE (flock, or msvcrt on Windows)."""
+    os.makedirs(os.path.dirname(RETENTION_LOCK_FILE) or ".", exist_ok=True)
+    handle = open(RETENTION_LOCK_FILE, "w")
+    try:
+        try:
+            import fcntl
+        except ImportError:  # Windows
+            import msvcrt
+            msvcrt.locking(handle.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return handle
+    except OSError:
+        # Held by another worker (BlockingIOError, or PermissionError from msvcrt)
+        handle.close()
+        return None
+
+
+def _release_lock(handle):
+    try:
+        import msvcrt
+    except ImportError:
+        pass
+    else:
+        handle.seek(0)
+        msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
+    # Closing the file releases the flock
+    handle.close()
+
+
+class RetentionSweeper:
+    """Runs sweep() every RETENTION_SWEEP_INTERVAL seconds in the API process."""
+
+    def __init__(self, interval: float = RETENTION_SWEEP_INTERVAL):
+        self.interval = interval
+        self.sweeps = 0
+        self.totals = {
+            "conversations_expired": 0, "messages_archived": 0,
+            "scopes_removed": 0, "chunks_removed": 0, "bytes_reclaimed": 0, "chunks_promoted": 0
+        }
+        self.last_report: Optional[dict] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def run_once(self) -> Optional[dict]:
+        lock = _try_lock()
+        if lock is None:
+            # Another worker is sweeping
+            return None
+        try:
+            report = sweep()
+        finally:
+            _release_lock(lock)
+        self.sweeps += 1
+        self.last_report = report
+        for key in self.totals:
+            self.totals[key] += report[key]
+        if (report["chunks_removed"] or report["conversations_expired"] or report["messages_archived"]
+                or report["chunks_promoted"]):
+            print(
+                f"Retention sweep: {report['conversations_expired']} conversations expired, "
+                f"{report['messages_archived']} messages archived, "
+                f"{report['scopes_removed']} scopes / {report['chunks_removed']} chunks removed, "
+                f"~{report['bytes_reclaimed']} bytes reclaimed, "
+                f"{report['chunks_promoted']} linked chunks indexed"
+            )
+        return report
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await run_in_threadpool(self.run_once)
+            except Exception as e:
+                print(f"Retention sweep failed: {e}")
+
+    def start(self):
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "interval": self.interval,
+            "idle_days": RETENTION_IDLE_DAYS,
+            "sweeps": self.sweeps,
+            "totals": dict(self.totals),
+            "last_report": self.last_report,
+        }
+
+
+retention_sweeper = RetentionSweeper()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Conversation retention and orphaned-chunk cleanup")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sweep_parser = sub.add_parser("sweep", help="Run one retention pass")
+    sweep_parser.add_argument("--idle-days", type=float, default=RETENTION_IDLE_DAYS,
+                              help="Also delete conversations idle for longer (0: keep them)")
+    sweep_parser.add_argument("--full-scan", action="store_true",
+                              help="Also scan the whole vector store for orphaned scopes (slow on large stores)")
+    args = parser.parse_args(argv)
+
+    from app.database import init_db
+    init_db()
+    print(json.dumps(sweep(idle_days=args.idle_days, full_scan=args.full_scan), indent=2))
+
+
+if __name__ == "__main__":
+    main()
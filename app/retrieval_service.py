@@ -0,0 +1,190 @@
+"""
+Retrieval service: the single owner of the Chroma index and embedding model.
+
+API workers and ingestion jobs talk to it through `app.vectorstore.RemoteCollection`
+(set RETRIEVAL_SERVICE_URL). Concurrent query texts are embedded together in
+micro-batches, which is where most of the CPU goes.
+
+Run with a single worker:
+    python -m app.retrieval_service
+"""
+import asyncio
+import os
+from typing import Any, Dict, List, Optional
+
+import uvicorn
+from fastapi import FastAPI, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel
+
+from app.vectorstore import open_local_collection, get_embedding_function
+
+HOST = os.getenv("RETRIEVAL_SERVICE_HOST", "127.0.0.1")
+PORT = int(os.getenv("RETRIEVAL_SERVICE_PORT", "8100"))
+# When set, listen on a Unix socket instead of TCP
+UDS = os.getenv("RETRIEVAL_SERVICE_UDS")
+BATCH_MAX = int(os.getenv("RETRIEVAL_BATCH_MAX", "32"))
+BATCH_WINDOW_MS = float(os.getenv("RETRIEVAL_BATCH_WINDOW_MS", "5"))
+
+
+class EmbeddingBatcher:
+    """
+    Collects texts from concurrent requests for up to BATCH_WINDOW_MS (or
+    BATCH_MAX texts) and embeds them in one model call.
+    """
+
+    def __init__(self, embedding_function):
+        self.embedding_function = embedding_function
+        self.queue: Optional[asyncio.Queue] = None
+        self.batches = 0
+        self.texts = 0
+
+    def start(self):
+        self.queue = asyncio.Queue()
+        asyncio.get_running_loop().create_task(self._run())
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        loop = asyncio.get_running_loop()
+        futures = []
+        for text in texts:
+            fut = loop.create_future()
+            await self.queue.put((text, fut))
+            futures.append(fut)
+        return await asyncio.gather(*futures)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            window_end = loop.time() + BATCH_WINDOW_MS / 1000
+            while len(batch) < BATCH_MAX:
+                timeout = window_end - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            texts = [text for text, _ in batch]
+            try:
+                vectors = await run_in_threadpool(self.embedding_function, texts)
+            except Exception as e:
+                for _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+                continue
+            self.batches += 1
+            self.texts += len(texts)
+            for (_, fut), vector in zip(batch, vectors):
+                if not fut.done():
+                    fut.set_result(_clean(vector))
+
+
+class QueryRequest(BaseModel):
+    query_texts: Optional[List[str]] = None
+    query_embeddings: Optional[List[List[float]]] = None
+    n_results: int = 10
+    where: Optional[Dict[str, Any]] = None
+    include: Optional[List[str]] = None
+
+class GetRequest(BaseModel):
+    ids: Optional[List[str]] = None
+    where: Optional[Dict[str, Any]] = None
+    limit: Optional[int] = None
+    offset: Optional[int] = None
+    include: Optional[List[str]] = None
+
+class UpsertRequest(BaseModel):
+    ids: List[str]
+    documents: Optional[List[str]] = None
+    metadatas: Optional[List[Dict[str, Any]]] = None
+    embeddings: Optional[List[List[float]]] = None
+
+class DeleteRequest(BaseModel):
+    ids: Optional[List[str]] = None
+    where: Optional[Dict[str, Any]] = None
+
+class EmbedRequest(BaseModel):
+    texts: List[str]
+
+
+service = FastAPI(title="ISO 9001 Retrieval Service")
+collection = None
+batcher = EmbeddingBatcher(get_embedding_function())
+
+
+def _clean(value):
+    """Chroma results may hold numpy arrays; make them JSON friendly."""
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    if isinstance(value, dict):
+        return {k: _clean(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_clean(v) for v in value]
+    return value
+
+
+def _kwargs(req: BaseModel) -> dict:
+    return {k: v for k, v in req.model_dump().items() if v is not None}
+
+
+@service.on_event("startup")
+async def startup():
+    global collection
+    collection = await run_in_threadpool(open_local_collection)
+    batcher.start()
+
+
+@service.post("/query")
+async def query(req: QueryRequest):
+    kwargs = _kwargs(req)
+    texts = kwargs.pop("query_texts", None)
+    if texts:
+        kwargs["query_embeddings"] = await batcher.embed(texts)
+    if not kwargs.get("query_embeddings"):
+        raise HTTPException(status_code=400, detail="query_texts or query_embeddings required")
+    return _clean(dict(await run_in_threadpool(collection.query, **kwargs)))
+
+
+@service.post("/get")
+async def get(req: GetRequest):
+    return _clean(dict(await run_in_threadpool(collection.get, **_kwargs(req))))
+
+
+@service.post("/upsert")
+async def upsert(req: UpsertRequest):
+    kwargs = _kwargs(req)
+    if "embeddings" not in kwargs and kwargs.get("documents"):
+        kwargs["embeddings"] = await batcher.embed(kwargs["documents"])
+    await run_in_threadpool(collection.upsert, **kwargs)
+    return {"status": "ok", "count": len(req.ids)}
+
+
+@service.post("/delete")
+async def delete(req: DeleteRequest):
+    await run_in_threadpool(collection.delete, **_kwargs(req))
+    return {"status": "ok"}
+
+
+@service.get("/count")
+async def count():
+    return {"count": await run_in_threadpool(collection.count)}
+
+
+@service.post("/embed")
+async def embed(req: EmbedRequest):
+    return {"embeddings": await batcher.embed(req.texts)}
+
+
+@service.get("/")
+def health_check():
+    return {"status": "Retrieval service is running", "batches": batcher.batches, "texts_embedded": batcher.texts}
+
+
+if __name__ == "__main__":
+    # One process must own the index: never run this with several workers
+    if UDS:
+        uvicorn.run(service, uds=UDS, workers=1)
+    else:
+        uvicorn.run(service, host=HOST, port=PORT, workers=1)
@@ -0,0 +1,25 @@
+from pydantic import BaseModel
+from typing import List, Dict
+
+class AuditJobResponse(BaseModel):
+    job_id: str
+    status: str
+    total_clauses: int
+
+class ClauseResult(BaseModel):
+    clause_id: str
+    title: str
+    status: str
+    finding: str
+    recommendation: str
+    evidence: List[str]
+
+class AuditReport(BaseModel):
+    job_id: str
+    status: str
+    total_clauses: int
+    evaluated_clauses: int
+    failed_clauses: int
+    summary: Dict[str, int]
+    gaps: List[ClauseResult]
+    clauses: List[ClauseResult]
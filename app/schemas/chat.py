@@ -17,3 +17,6 @@ class Citation(BaseModel):
 class ChatResponse(BaseModel):
     answer: str
     citations: List[Citation]
+    # Set when a stage overran its time budget and the answer was built in a reduced mode
+    degraded: bool = False
+    degradations: List[str] = []
@@ -1,9 +1,27 @@
 from pydantic import BaseModel
 from datetime import datetime
-from typing import List
+from typing import List, Optional
 
 class ConversationCreateResponse(BaseModel):
     convo_id: str
 
+class ConversationSummary(BaseModel):
+    id: str
+    created_at: Optional[str] = None
+    last_activity_at: Optional[str] = None
+    message_count: int = 0
+
 class ConversationListResponse(BaseModel):
     conversations: List[str]
+    items: List[ConversationSummary] = []
+    next_cursor: Optional[str] = None
+
+class HistoryMessage(BaseModel):
+    id: int
+    role: str
+    content: str
+    timestamp: Optional[str] = None
+
+class HistoryResponse(BaseModel):
+    history: List[HistoryMessage]
+    next_cursor: Optional[str] = None
@@ -1,5 +1,12 @@
+from typing import Optional
 from pydantic import BaseModel
 
 class DocumentUploadResponse(BaseModel):
     status: str
     chunks_added: int
+    # Near-duplicate chunks that were not indexed (see app/dedup.py)
+    chunks_skipped: int = 0
+    dedup_ratio: float = 0.0
+    # Size and SHA-256 of the uploaded file
+    bytes: int = 0
+    sha256: Optional[str] = None
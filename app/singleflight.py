@@ -0,0 +1,69 @@
+import asyncio
+import re
+from typing import Any, Callable, Dict, Hashable
+
+from fastapi.concurrency import run_in_threadpool
+
+
+def normalize_question(question: str) -> str:
+    """
+    Canonical form of a question used as a coalescing key.
+    Case and whitespace differences do not change retrieval or generation.
+    """
+    return re.sub(r"\s+", " ", question).strip().lower()
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls sharing the same key into one execution.
+
+    The first caller (leader) starts the work; callers arriving while it is
+    in flight await the same task and receive the same result (or exception).
+    The key is released as soon as the work finishes, so nothing is cached.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self.executed = 0
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        task = self._inflight.get(key)
+        if task is None:
+            if asyncio.iscoroutinefunction(fn):
+                coro = fn(*args, **kwargs)
+            else:
+                # Blocking calls (Chroma, LLM SDKs) run in the threadpool so
+                # other requests can join the flight meanwhile
+                coro = run_in_threadpool(fn, *args, **kwargs)
+            task = asyncio.ensure_future(coro)
+            self._inflight[key] = task
+            task.add_done_callback(lambda t, k=key: self._release(k, t))
+            self.executed += 1
+        else:
+            self.coalesced += 1
+
+        # Shield: one waiter being cancelled must not cancel the shared work
+        return await asyncio.shield(task)
+
+    def _release(self, key: Hashable, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            # Mark the exception as retrieved even if every waiter gave up on it
+            task.exception()
+
+    def stats(self) -> dict:
+        total = self.executed + self.coalesced
+        return {
+            "name": self.name,
+            "in_flight": len(self._inflight),
+            "executed": self.executed,
+            "coalesced": self.coalesced,
+            "coalesced_ratio": round(self.coalesced / total, 4) if total else 0.0,
+        }
+
+
+retrieval_flight = SingleFlight("retrieval")
+generation_flight = SingleFlight("generation")
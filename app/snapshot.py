@@ -0,0 +1,309 @@
+"""
+Vector index snapshots: export the collection once, bulk-load it on new nodes
+without re-embedding.
+
+Layout of a snapshot directory (all little-endian, memory-mappable):
+    manifest.json       format version, embedding model id, count, dim, sha256 per file
+    embeddings.f32      float32 matrix [count, dim], row-major
+    ids.bin / ids.off   UTF-8 strings back to back + uint64 offsets [count + 1]
+    documents.bin/.off  same layout
+    metadatas.bin/.off  same layout, one JSON object per row
+    dedup.jsonl         near-duplicate state of the exported chunks (signatures
+                        and links, see app/dedup.py); absent from older snapshots
+
+Usage:
+    python -m app.snapshot export ./snapshots/iso_docs [--scope global]
+    python -m app.snapshot import ./snapshots/iso_docs [--force] [--no-verify]
+    python -m app.snapshot info ./snapshots/iso_docs
+"""
+import argparse
+import hashlib
+import json
+import logging
+import sys
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from app.vectorstore import get_chroma_collection, COLLECTION_NAME, EMBEDDING_MODEL_ID
+from app.database import SessionLocal
+from app.dedup import iter_state, load_state
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+FORMAT_NAME = "iso-docs-snapshot"
+FORMAT_VERSION = 1
+BATCH_SIZE = 1000
+STRING_COLUMNS = ("ids", "documents", "metadatas")
+DEDUP_FILE = "dedup.jsonl"
+
+
+class SnapshotError(Exception):
+    pass
+
+
+class _HashingWriter:
+    """Appends to a file while computing its sha256 and size."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.fh = open(path, "wb")
+        self.sha = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data: bytes):
+        self.fh.write(data)
+        self.sha.update(data)
+        self.size += len(data)
+
+    def close(self) -> Dict[str, object]:
+        self.fh.close()
+        return {"sha256": self.sha.hexdigest(), "bytes": self.size}
+
+
+class _StringColumnWriter:
+    def __init__(self, directory: Path, name: str):
+        self.blob = _HashingWriter(directory / f"{name}.bin")
+        self.offsets = _HashingWriter(directory / f"{name}.off")
+        self.offsets.write(np.array([0], dtype="<u8").tobytes())
+
+    def extend(self, values: List[str]):
+        encoded = [v.encode("utf-8") for v in values]
+        ends = self.blob.size + np.cumsum([len(e) for e in encoded], dtype="<u8")
+        self.blob.write(b"".join(encoded))
+        self.offsets.write(ends.astype("<u8").tobytes())
+
+    def close(self, files: Dict[str, dict]):
+        files[self.blob.path.name] = self.blob.close()
+        files[self.offsets.path.name] = self.offsets.close()
+
+
+class StringColumn:
+    """Read-only, memory-mapped view of a string column."""
+
+    def __init__(self, directory: Path, name: str):
+        self.offsets = np.memmap(directory / f"{name}.off", dtype="<u8", mode="r")
+        blob_path = directory / f"{name}.bin"
+        # np.memmap refuses empty files (e.g. a column of empty strings)
+        self.blob = np.memmap(blob_path, dtype=np.uint8, mode="r") if blob_path.stat().st_size else np.zeros(0, np.uint8)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> str:
+        return bytes(self.blob[self.offsets[i]:self.offsets[i + 1]]).decode("utf-8")
+
+    def slice(self, start: int, stop: int) -> List[str]:
+        return [self[i] for i in range(start, min(stop, len(self)))]
+
+
+class Snapshot:
+    """Opened snapshot: manifest plus memory-mapped columns."""
+
+    def __init__(self, directory, verify: bool = True):
+        self.directory = Path(directory)
+        manifest_path = self.directory / "manifest.json"
+        if not manifest_path.exists():
+            raise SnapshotError(f"No manifest.json in {self.directory}")
+        self.manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+        if self.manifest.get("format") != FORMAT_NAME or self.manifest.get("version") != FORMAT_VERSION:
+            raise SnapshotError(f"Unsupported snapshot format: {self.manifest.get('format')} v{self.manifest.get('version')}")
+        if verify:
+            self.verify()
+
+        self.count = self.manifest["count"]
+        self.dim = self.manifest["dim"]
+        self.embedding_model = self.manifest["embedding_model"]
+        if self.count:
+            self.embeddings = np.memmap(self.directory / "embeddings.f32", dtype="<f4", mode="r", shape=(self.count, self.dim))
+        else:
+            self.embeddings = np.zeros((0, self.dim), dtype="<f4")
+        self.columns = {name: StringColumn(self.directory, name) for name in STRING_COLUMNS}
+
+    def verify(self):
+        for name, expected in self.manifest["files"].items():
+            sha = hashlib.sha256()
+            with open(self.directory / name, "rb") as fh:
+                for block in iter(lambda: fh.read(1 << 20), b""):
+                    sha.update(block)
+            if sha.hexdigest() != expected["sha256"]:
+                raise SnapshotError(f"Checksum mismatch for {name}")
+
+    def batches(self, size: int = BATCH_SIZE) -> Iterator[dict]:
+        for start in range(0, self.count, size):
+            stop = min(start + size, self.count)
+            yield {
+                "ids": self.columns["ids"].slice(start, stop),
+                "documents": self.columns["documents"].slice(start, stop),
+                "metadatas": [json.loads(m) for m in self.columns["metadatas"].slice(start, stop)],
+                "embeddings": np.asarray(self.embeddings[start:stop]),
+            }
+
+    def dedup_rows(self) -> Iterator[dict]:
+        path = self.directory / DEDUP_FILE
+        if not path.exists():
+            return
+        with open(path, encoding="utf-8") as fh:
+            for line in fh:
+                if line.strip():
+                    yield json.loads(line)
+
+    def stats(self) -> dict:
+        """Chunk counts per (source, scope), read from the metadata column only."""
+        counts: Dict[tuple, int] = {}
+        metadatas = self.columns["metadatas"]
+        for i in range(len(metadatas)):
+            m = json.loads(metadatas[i])
+            key = (m.get("source", "Unknown"), m.get("scope", "Unknown"))
+            counts[key] = counts.get(key, 0) + 1
+        return counts
+
+
+def _export_dedup(out: Path, scope: Optional[str], db=None) -> Tuple[dict, Dict[str, int]]:
+    own_db = db is None
+    db = db or SessionLocal()
+    writer = _HashingWriter(out / DEDUP_FILE)
+    counts = {"signatures": 0, "links": 0}
+    try:
+        for row in iter_state(db, scope):
+            writer.write((json.dumps(row, ensure_ascii=False) + "\n").encode("utf-8"))
+            counts["signatures" if row["kind"] == "signature" else "links"] += 1
+    finally:
+        if own_db:
+            db.close()
+    return writer.close(), counts
+
+
+def export_snapshot(directory, scope: Optional[str] = None, collection=None, db=None) -> dict:
+    """
+    Writes the chunks of `scope` (every scope when None) and their
+    near-duplicate state, so that an imported node deduplicates against them.
+    """
+    collection = collection or get_chroma_collection()
+    out = Path(directory)
+    out.mkdir(parents=True, exist_ok=True)
+
+    embeddings = _HashingWriter(out / "embeddings.f32")
+    columns = {name: _StringColumnWriter(out, name) for name in STRING_COLUMNS}
+    where = {"scope": scope} if scope else None
+    count, dim, offset = 0, None, 0
+
+    while True:
+        kwargs = {"include": ["documents", "metadatas", "embeddings"], "limit": BATCH_SIZE, "offset": offset}
+        if where:
+            kwargs["where"] = where
+        batch = collection.get(**kwargs)
+        ids = batch["ids"]
+        if not ids:
+            break
+        matrix = np.asarray(batch["embeddings"], dtype="<f4")
+        if dim is None:
+            dim = matrix.shape[1]
+        elif matrix.shape[1] != dim:
+            raise SnapshotError(f"Inconsistent embedding dimension: {matrix.shape[1]} != {dim}")
+
+        embeddings.write(np.ascontiguousarray(matrix).tobytes())
+        columns["ids"].extend(ids)
+        columns["documents"].extend([d or "" for d in batch["documents"]])
+        columns["metadatas"].extend([json.dumps(m or {}, ensure_ascii=False) for m in batch["metadatas"]])
+        count += len(ids)
+        offset += len(ids)
+        logger.info(f"  exported {count} chunks")
+
+    files = {"embeddings.f32": embeddings.close()}
+    for column in columns.values():
+        column.close(files)
+    files[DEDUP_FILE], dedup_counts = _export_dedup(out, scope, db)
+
+    manifest = {
+        "format": FORMAT_NAME,
+        "version": FORMAT_VERSION,
+        "collection": COLLECTION_NAME,
+        "embedding_model": EMBEDDING_MODEL_ID,
+        "scope": scope,
+        "count": count,
+        "dim": dim or 0,
+        "dedup": dedup_counts,
+        "created_at": datetime.utcnow().isoformat(),
+        "files": files,
+    }
+    (out / "manifest.json").write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+    return manifest
+
+
+def import_snapshot(directory, force: bool = False, verify: bool = True, collection=None, db=None) -> int:
+    """
+    Bulk-loads a snapshot with its stored embeddings (no re-embedding), then
+    its near-duplicate state. Returns chunks loaded.
+    """
+    snap = Snapshot(directory, verify=verify)
+    if snap.embedding_model != EMBEDDING_MODEL_ID and not force:
+        raise SnapshotError(
+            f"Snapshot was embedded with {snap.embedding_model}, this node uses {EMBEDDING_MODEL_ID}. "
+            "Re-run ingestion or pass --force."
+        )
+    collection = collection or get_chroma_collection()
+    loaded = 0
+    for batch in snap.batches():
+        collection.upsert(**batch)
+        loaded += len(batch["ids"])
+        logger.info(f"  imported {loaded}/{snap.count} chunks")
+
+    if not (snap.directory / DEDUP_FILE).exists():
+        logger.warning("⚠️ Snapshot has no dedup state: new uploads are not checked against its chunks")
+        return loaded
+    own_db = db is None
+    db = db or SessionLocal()
+    try:
+        counts = load_state(db, snap.dedup_rows())
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        if own_db:
+            db.close()
+    logger.info(f"  imported dedup state: {counts['signatures']} signatures, {counts['links']} links")
+    return loaded
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export / import vector index snapshots")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_export = sub.add_parser("export", help="Write the collection to a snapshot directory")
+    p_export.add_argument("directory")
+    p_export.add_argument("--scope", help="Only export one scope (e.g. global)")
+
+    p_import = sub.add_parser("import", help="Bulk-load a snapshot into the collection")
+    p_import.add_argument("directory")
+    p_import.add_argument("--force", action="store_true", help="Ignore an embedding model mismatch")
+    p_import.add_argument("--no-verify", action="store_true", help="Skip checksum verification")
+
+    p_info = sub.add_parser("info", help="Show a snapshot manifest")
+    p_info.add_argument("directory")
+
+    args = parser.parse_args(argv)
+    if args.command != "info":
+        # The dedup state lives in the relational DB
+        from app.database import init_db
+        init_db()
+    try:
+        if args.command == "export":
+            manifest = export_snapshot(args.directory, scope=args.scope)
+            logger.info(f"🎯 Snapshot written: {manifest['count']} chunks, dim {manifest['dim']} -> {args.directory}")
+        elif args.command == "import":
+            loaded = import_snapshot(args.directory, force=args.force, verify=not args.no_verify)
+            logger.info(f"🎯 Snapshot imported: {loaded} chunks")
+        else:
+            print(json.dumps(Snapshot(args.directory, verify=False).manifest, indent=2))
+    except SnapshotError as e:
+        logger.error(f"❌ {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
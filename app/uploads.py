@@ -0,0 +1,182 @@
+"""
+Bounded upload pipeline.
+
+Memory per upload does not grow with the file size:
+- UploadLimitMiddleware rejects bodies over UPLOAD_MAX_BYTES, from the
+  Content-Length header when there is one, otherwise as soon as the streamed
+  body crosses the limit. Starlette spools multipart files to a temporary
+  file past 1 MB.
+- stage_file() hashes the spooled file block by block (sha256) and maps it
+  into memory, so the parsers read pages from the OS page cache instead of an
+  in-memory copy.
+- .md/.txt files are decoded incrementally (see app.utils.iter_paragraphs).
+"""
+import hashlib
+import mmap
+import os
+import tempfile
+from contextlib import contextmanager
+from typing import Iterator
+
+from fastapi import HTTPException
+
+from app.utils import process_file_stream, PageLimitExceeded
+
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(50 * 1024 * 1024)))
+# PDF pages / Excel sheets
+UPLOAD_MAX_PAGES = int(os.getenv("UPLOAD_MAX_PAGES", "1000"))
+READ_BLOCK = 64 * 1024
+# Room for the multipart boundaries and headers around the file
+MULTIPART_OVERHEAD = 64 * 1024
+
+UPLOAD_PATHS = ("/documents", "/documents/global")
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class StagedFile:
+    def __init__(self, view, size: int, sha256: str):
+        # mmap (or an empty buffer for empty files); seekable and readable like a file
+        self.view = view
+        self.size = size
+        self.sha256 = sha256
+
+
+def _as_file(stream):
+    """Returns a stream backed by a real file descriptor, spooling it if needed."""
+    try:
+        # SpooledTemporaryFile rolls its (bounded) in-memory part to disk here
+        stream.fileno()
+        return stream, False
+    except (AttributeError, OSError, ValueError):
+        spool = tempfile.TemporaryFile()
+        stream.seek(0)
+        while True:
+            block = stream.read(READ_BLOCK)
+            if not block:
+                break
+            spool.write(block)
+        spool.flush()
+        return spool, True
+
+
+class _EmptyView:
+    def read(self, n: int = -1) -> bytes:
+        return b""
+
+    def seek(self, offset: int, whence: int = 0) -> int:
+        return 0
+
+    def tell(self) -> int:
+        return 0
+
+
+@contextmanager
+def stage_file(stream, max_bytes: int = UPLOAD_MAX_BYTES) -> Iterator[StagedFile]:
+    """
+    Hashes `stream` (an uploaded or local file) and yields it memory-mapped.
+    Raises UploadTooLarge past `max_bytes`.
+    """
+    stream, owned = _as_file(stream)
+    try:
+        stream.seek(0)
+        digest = hashlib.sha256()
+        size = 0
+        while True:
+            block = stream.read(READ_BLOCK)
+            if not block:
+                break
+            size += len(block)
+            if size > max_bytes:
+                raise UploadTooLarge(f"File exceeds {max_bytes} bytes")
+            digest.update(block)
+
+        if size == 0:
+            # Empty files cannot be mapped
+            yield StagedFile(_EmptyView(), 0, digest.hexdigest())
+            return
+        view = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            yield StagedFile(view, size, digest.hexdigest())
+        finally:
+            view.close()
+    finally:
+        if owned:
+            stream.close()
+
+
+def extract_chunks(stream, filename: str) -> dict:
+    """
+    Stages an upload and chunks it. Returns {"chunks", "bytes", "sha256"}.
+    Raises HTTPException(413) when a size or page limit is exceeded.
+    """
+    try:
+        with stage_file(stream) as staged:
+            chunks = process_file_stream(staged.view, filename, max_pages=UPLOAD_MAX_PAGES)
+            return {"chunks": chunks, "bytes": staged.size, "sha256": staged.sha256}
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except PageLimitExceeded as e:
+        raise HTTPException(status_code=413, detail=f"Too many pages: {e}")
+
+
+class UploadLimitMiddleware:
+    """
+    Stops oversized document uploads before they are spooled: by Content-Length
+    when the client sends one, otherwise while the body streams in.
+    """
+
+    def __init__(self, app, max_bytes: int = UPLOAD_MAX_BYTES):
+        self.app = app
+        self.limit = max_bytes + MULTIPART_OVERHEAD
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or not scope["path"].endswith(UPLOAD_PATHS):
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        content_length = headers.get(b"content-length")
+        if content_length and content_length.isdigit() and int(content_length) > self.limit:
+            await self._reject(send)
+            return
+
+        received = 0
+        rejected = False
+
+        async def limited_receive():
+            nonlocal received, rejected
+            if rejected:
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.limit:
+                    # Answer now and make the app see a disconnected client
+                    rejected = True
+                    await self._reject(send)
+                    return {"type": "http.disconnect"}
+            return message
+
+        async def guarded_send(message):
+            # Whatever the app answers to the disconnect is dropped
+            if not rejected:
+                await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except Exception:
+            # The app may fail on the disconnect (ClientDisconnect); the 413 is already sent
+            if not rejected:
+                raise
+
+    async def _reject(self, send):
+        body = b'{"detail":"File exceeds the upload limit"}'
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -1,8 +1,21 @@
 from pypdf import PdfReader
+import codecs
 import io
 import pandas as pd
 import re
 
+# Bytes decoded at a time for .md/.txt files
+TEXT_DECODE_BLOCK = 64 * 1024
+
+
+class PageLimitExceeded(Exception):
+    """The document has more pages (PDF) or sheets (Excel) than allowed."""
+    def __init__(self, pages: int, max_pages: int):
+        super().__init__(f"{pages} pages, the limit is {max_pages}")
+        self.pages = pages
+        self.max_pages = max_pages
+
+
 def recursive_chunk_text(text: str, chunk_size: int = 1500, overlap: int = 300) -> list[str]:
     """
     Splits text into chunks of roughly `chunk_size` characters with `overlap`.
@@ -60,11 +73,18 @@ def recursive_chunk_text(text: str, chunk_size: int = 1500, overlap: int = 300)
             start = end
             
     # Let's use a simpler verified approach for this snippet to be robust
-    final_chunks = []
     # Token-ish splitting
     # 1. Clean text
     # 2. Split by paragraphs
     paragraphs = re.split(r'\n\n+', text)
+    return pack_paragraphs(paragraphs, chunk_size)
+
+def pack_paragraphs(paragraphs, chunk_size: int = 1500) -> list[str]:
+    """
+    Packs paragraphs into chunks of at most roughly `chunk_size` characters.
+    `paragraphs` can be any iterable, so text can be chunked as it is decoded.
+    """
+    final_chunks = []
     current_chunk = []
     current_len = 0
     
@@ -95,9 +115,31 @@ def recursive_chunk_text(text: str, chunk_size: int = 1500, overlap: int = 300)
         
     return final_chunks
 
-def process_pdf_stream(file_stream) -> list[str]:
+def iter_paragraphs(file_stream, block_size: int = TEXT_DECODE_BLOCK):
+    """
+    Decodes a UTF-8 byte stream (file, mmap) block by block and yields its
+    paragraphs, without materializing the whole text.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    pending = ""
+    while True:
+        block = file_stream.read(block_size)
+        scanned = max(len(pending) - 1, 0)
+        pending += decoder.decode(block or b"", final=not block)
+        cut = pending.rfind("\n\n", scanned)
+        if cut != -1:
+            yield from re.split(r'\n\n+', pending[:cut])
+            # The rest of the separator run stays in front of the next paragraph and is stripped
+            pending = pending[cut:]
+        if not block:
+            break
+    yield pending
+
+def process_pdf_stream(file_stream, max_pages: int = None) -> list[str]:
     try:
         pdf = PdfReader(file_stream)
+        if max_pages and len(pdf.pages) > max_pages:
+            raise PageLimitExceeded(len(pdf.pages), max_pages)
         text_content = []
         for page in pdf.pages:
             t = page.extract_text()
@@ -106,27 +148,32 @@ def process_pdf_stream(file_stream) -> list[str]:
         
         full_text = "\n\n".join(text_content)
         return recursive_chunk_text(full_text)
+    except PageLimitExceeded:
+        raise
     except Exception as e:
         print(f"PDF Error: {e}")
         return []
 
-def process_file_stream(file_stream, filename: str) -> list[str]:
+def process_file_stream(file_stream, filename: str, max_pages: int = None) -> list[str]:
+    """
+    Extracts and chunks a document. `file_stream` can be bytes or any seekable
+    binary stream; app.uploads hands in a memory-mapped file.
+    """
     filename = filename.lower()
     
     if filename.endswith(".pdf"):
-        return process_pdf_stream(file_stream)
+        return process_pdf_stream(file_stream, max_pages)
         
     elif filename.endswith(".md") or filename.endswith(".txt"):
         try:
             # Handle bytes vs string
             if isinstance(file_stream, bytes):
                 text = file_stream.decode("utf-8")
+            elif isinstance(file_stream, io.TextIOBase):
+                text = file_stream.read()
             elif hasattr(file_stream, "read"):
-                content = file_stream.read()
-                if isinstance(content, bytes):
-                    text = content.decode("utf-8")
-                else:
-                    text = content
+                # Decoded incrementally: only the paragraph being packed is held as text
+                return pack_paragraphs(iter_paragraphs(file_stream))
             else:
                 text = str(file_stream)
                 
@@ -139,6 +186,8 @@ def process_file_stream(file_stream, filename: str) -> list[str]:
         try:
             chunks = []
             excel_file = pd.ExcelFile(file_stream)
+            if max_pages and len(excel_file.sheet_names) > max_pages:
+                raise PageLimitExceeded(len(excel_file.sheet_names), max_pages)
             all_text = []
             for sheet_name in excel_file.sheet_names:
                 df = pd.read_excel(excel_file, sheet_name=sheet_name)
@@ -148,6 +197,8 @@ def process_file_stream(file_stream, filename: str) -> list[str]:
             
             full_text = "\n\n".join(all_text)
             return recursive_chunk_text(full_text)
+        except PageLimitExceeded:
+            raise
         except Exception as e:
             print(f"Excel Error: {e}")
             return []
@@ -0,0 +1,219 @@
+"""
+Access to the `iso_docs` vector collection.
+
+By default the collection is opened in-process (PersistentClient). When
+RETRIEVAL_SERVICE_URL is set, a thin HTTP client talks to the retrieval
+service (`python -m app.retrieval_service`) instead, so several API workers
+and ingestion jobs share one index and one embedding model.
+"""
+import http.client
+import json
+import os
+import socket
+import threading
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlparse
+
+import chromadb
+from chromadb.config import Settings
+from chromadb.errors import NotFoundError
+from chromadb.utils import embedding_functions
+from dotenv import load_dotenv
+
+load_dotenv()
+
+CHROMA_PATH = os.getenv("CHROMA_PERSIST_DIRECTORY", "./data/chroma_db")
+COLLECTION_NAME = "iso_docs"
+# Chroma's default embedding function (ONNX all-MiniLM-L6-v2)
+EMBEDDING_MODEL_ID = "all-MiniLM-L6-v2"
+RETRIEVAL_SERVICE_URL = os.getenv("RETRIEVAL_SERVICE_URL")
+# HNSW parameters applied when the collection is created (tune them with app.index_maintenance)
+HNSW_M = os.getenv("HNSW_M")
+HNSW_EF_CONSTRUCTION = os.getenv("HNSW_EF_CONSTRUCTION")
+HNSW_EF_SEARCH = os.getenv("HNSW_EF_SEARCH")
+
+_collection = None
+_embedding_function = None
+_lock = threading.Lock()
+
+
+def get_embedding_function():
+    return embedding_functions.DefaultEmbeddingFunction()
+
+
+def get_chroma_client():
+    return chromadb.PersistentClient(
+        path=CHROMA_PATH,
+        settings=Settings(anonymized_telemetry=False)
+    )
+
+
+def hnsw_configuration(m=None, ef_construction=None, ef_search=None, space: str = "l2") -> Dict[str, Any]:
+    """Chroma collection configuration; unset values keep Chroma's defaults."""
+    hnsw: Dict[str, Any] = {"space": space}
+    for key, value in (("max_neighbors", m or HNSW_M),
+                       ("ef_construction", ef_construction or HNSW_EF_CONSTRUCTION),
+                       ("ef_search", ef_search or HNSW_EF_SEARCH)):
+        if value:
+            hnsw[key] = int(value)
+    return {"hnsw": hnsw}
+
+
+def open_local_collection(client=None, name: str = COLLECTION_NAME):
+    client = client or get_chroma_client()
+    try:
+        return client.get_collection(name, embedding_function=get_embedding_function())
+    except (NotFoundError, ValueError):
+        # HNSW parameters can only be chosen at creation time
+        return client.create_collection(
+            name,
+            configuration=hnsw_configuration(),
+            embedding_function=get_embedding_function()
+        )
+
+
+def get_chroma_collection():
+    """
+    Returns the shared collection handle (local, or remote when the retrieval
+    service is configured). Opened lazily on first use, not at import time.
+    """
+    global _collection
+    if _collection is None:
+        with _lock:
+            if _collection is None:
+                if RETRIEVAL_SERVICE_URL:
+                    _collection = RemoteCollection(RETRIEVAL_SERVICE_URL)
+                else:
+                    _collection = open_local_collection()
+    return _collection
+
+
+def embed_texts(texts: List[str]) -> List[List[float]]:
+    """Embeds texts with the collection's model (in the retrieval service when configured)."""
+    global _embedding_function
+    collection = get_chroma_collection()
+    if isinstance(collection, RemoteCollection):
+        return collection.embed(texts)
+    if _embedding_function is None:
+        _embedding_function = get_embedding_function()
+    return [[float(x) for x in vector] for vector in _embedding_function(texts)]
+
+
+class RetrievalServiceError(Exception):
+    pass
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path: str, timeout: float):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+def _to_jsonable(value):
+    # Embeddings come back as numpy arrays
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    raise TypeError(f"Not JSON serializable: {type(value).__name__}")
+
+
+def _closed_while_idle(error: Exception, sent: bool) -> bool:
+    """
+    Whether a request on a reused keep-alive connection failed because the
+    service had closed it: the send fails, or the service hangs up without a
+    status line. Timeouts and failures once a response started are not: the
+    service may have done the work, so they are never retried.
+    """
+    if isinstance(error, (socket.timeout, TimeoutError)):
+        return False
+    if not sent:
+        return isinstance(error, (BrokenPipeError, ConnectionResetError, ConnectionAbortedError))
+    return isinstance(error, http.client.RemoteDisconnected)
+
+
+class RemoteCollection:
+    """
+    Drop-in for the subset of chromadb's Collection API used by the app
+    (query / get / upsert / delete / count) backed by the retrieval service.
+
+    Accepts `http://host:port` or `unix:///path/to/socket`. Each thread keeps
+    its own keep-alive connection.
+    """
+
+    def __init__(self, url: str, timeout: float = 60.0):
+        parsed = urlparse(url)
+        self.scheme = parsed.scheme
+        self.host = parsed.hostname
+        self.port = parsed.port
+        self.socket_path = parsed.path if parsed.scheme == "unix" else None
+        self.timeout = timeout
+        self.name = COLLECTION_NAME
+        self._local = threading.local()
+
+    def _connection(self) -> http.client.HTTPConnection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            if self.socket_path:
+                conn = _UnixHTTPConnection(self.socket_path, self.timeout)
+            else:
+                conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            self._local.conn = conn
+        return conn
+
+    def _request(self, method: str, path: str, payload: Optional[Dict[str, Any]] = None) -> Any:
+        body = json.dumps(payload, default=_to_jsonable) if payload is not None else None
+        headers = {"Content-Type": "application/json"}
+        for attempt in range(2):
+            conn = self._connection()
+            # Only a connection kept alive from an earlier request can have been closed meanwhile
+            reused = conn.sock is not None
+            sent = False
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                sent = True
+                response = conn.getresponse()
+                data = response.read()
+                break
+            except Exception as e:
+                conn.close()
+                self._local.conn = None
+                if attempt or not reused or not _closed_while_idle(e, sent):
+                    raise
+        if response.status >= 400:
+            raise RetrievalServiceError(f"{method} {path} -> {response.status}: {data.decode('utf-8', 'replace')}")
+        return json.loads(data)
+
+    def query(self, query_texts: Optional[List[str]] = None, query_embeddings=None, n_results: int = 10,
+              where: Optional[Dict] = None, include: Optional[List[str]] = None):
+        return self._request("POST", "/query", {
+            "query_texts": query_texts,
+            "query_embeddings": query_embeddings,
+            "n_results": n_results,
+            "where": where,
+            "include": include,
+        })
+
+    def get(self, ids: Optional[List[str]] = None, where: Optional[Dict] = None, limit: Optional[int] = None,
+            offset: Optional[int] = None, include: Optional[List[str]] = None):
+        return self._request("POST", "/get", {
+            "ids": ids, "where": where, "limit": limit, "offset": offset, "include": include,
+        })
+
+    def upsert(self, ids: List[str], documents: Optional[List[str]] = None, metadatas: Optional[List[Dict]] = None,
+               embeddings=None):
+        self._request("POST", "/upsert", {
+            "ids": ids, "documents": documents, "metadatas": metadatas, "embeddings": embeddings,
+        })
+
+    def delete(self, ids: Optional[List[str]] = None, where: Optional[Dict] = None):
+        self._request("POST", "/delete", {"ids": ids, "where": where})
+
+    def count(self) -> int:
+        return self._request("GET", "/count")["count"]
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        return self._request("POST", "/embed", {"texts": texts})["embeddings"]
@@ -0,0 +1,179 @@
+"""
+Per-conversation retrieval working set.
+
+Keeps the chunks retrieved for a conversation's previous turn for
+WORKING_SET_TTL seconds. A follow-up question ("and what about
+the records for that?") reuses them and only runs a small incremental search,
+embedded together with the previous question so the follow-up has context.
+
+The set lives in process memory: with several API workers each keeps its own,
+and invalidate() only reaches the worker that handled the change (an entry
+can also be stored by a request that started before it). Reused chunks are
+therefore checked against the collection before each reuse: chunks deleted
+or rewritten since are dropped, and the others are re-scored against the
+current search embedding (see merge()).
+"""
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+WORKING_SET_TTL = float(os.getenv("WORKING_SET_TTL", "900"))
+WORKING_SET_MAX_CONVERSATIONS = int(os.getenv("WORKING_SET_MAX_CONVERSATIONS", "5000"))
+# Cosine similarity to the previous question above which a question is a follow-up
+FOLLOWUP_MIN_SIMILARITY = float(os.getenv("FOLLOWUP_MIN_SIMILARITY", "0.6"))
+# Short questions referring back ("that", "it", "also"...) need less similarity
+FOLLOWUP_ANAPHORA_SIMILARITY = float(os.getenv("FOLLOWUP_ANAPHORA_SIMILARITY", "0.25"))
+# Results per scope for the incremental search of a follow-up (vs 5 for a fresh search)
+FOLLOWUP_INCREMENTAL_RESULTS = int(os.getenv("FOLLOWUP_INCREMENTAL_RESULTS", "2"))
+MAX_CHUNKS_PER_SCOPE = 5
+
+ANAPHORA = re.compile(
+    r"\b(that|this|those|these|it|its|they|them|there|same|also|above|previous|and what about|what about)\b",
+    re.IGNORECASE
+)
+
+
+def _unit(vector) -> np.ndarray:
+    v = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(v)
+    return v / norm if norm else v
+
+
+class _Entry:
+    def __init__(self, question: str, embedding: np.ndarray, chunks: Dict[str, list], expires_at: float):
+        self.question = question
+        self.embedding = embedding
+        # scope -> [(id, document, metadata, distance)], best first
+        self.chunks = chunks
+        self.expires_at = expires_at
+
+
+class WorkingSet:
+    def __init__(self, ttl: float = WORKING_SET_TTL, max_conversations: int = WORKING_SET_MAX_CONVERSATIONS):
+        self.ttl = ttl
+        self.max_conversations = max_conversations
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.hits = 0
+        self.expired = 0
+        self.chunks_reused = 0
+
+    def get(self, convo_id: str) -> Optional[_Entry]:
+        with self._lock:
+            self.lookups += 1
+            entry = self._entries.get(convo_id)
+            if entry is None:
+                return None
+            if entry.expires_at < time.monotonic():
+                del self._entries[convo_id]
+                self.expired += 1
+                return None
+            self._entries.move_to_end(convo_id)
+            return entry
+
+    def is_follow_up(self, entry: _Entry, question: str, embedding) -> bool:
+        similarity = float(np.dot(entry.embedding, _unit(embedding)))
+        if similarity >= FOLLOWUP_MIN_SIMILARITY:
+            return True
+        return len(question.split()) <= 12 and bool(ANAPHORA.search(question)) and similarity >= FOLLOWUP_ANAPHORA_SIMILARITY
+
+    def search_embedding(self, entry: _Entry, embedding) -> List[float]:
+        """The follow-up embedded in the context of the previous question."""
+        return _unit(entry.embedding + _unit(embedding)).tolist()
+
+    def reused_ids(self, entry: _Entry) -> List[str]:
+        return [row[0] for rows in entry.chunks.values() for row in rows]
+
+    def merge(self, entry: _Entry, scope: str, incremental: dict, current: Dict[str, tuple], embedding) -> dict:
+        """
+        Combines the reused chunks of a scope with the incremental results into
+        one Chroma-shaped result, best distance first, without duplicates.
+
+        `current` maps the reused chunk ids still in the collection to their
+        (document, embedding): the others, and those whose text changed, are
+        dropped. Reused chunks are re-scored against `embedding`, the one the
+        incremental search ran with, so that all distances are comparable.
+        """
+        query = np.asarray(embedding, dtype=np.float32)
+        rows = []
+        for chunk_id, document, metadata, _ in entry.chunks.get(scope, []):
+            found = current.get(chunk_id)
+            if found is None or found[0] != document:
+                continue
+            # Chroma's "l2" space: squared euclidean distance
+            distance = float(np.sum((np.asarray(found[1], dtype=np.float32) - query) ** 2))
+            rows.append((chunk_id, document, metadata, distance))
+        reused = len(rows)
+        seen = {row[0] for row in rows}
+        if incremental.get("ids") and incremental["ids"][0]:
+            for i, chunk_id in enumerate(incremental["ids"][0]):
+                if chunk_id in seen:
+                    continue
+                seen.add(chunk_id)
+                rows.append((
+                    chunk_id,
+                    incremental["documents"][0][i],
+                    incremental["metadatas"][0][i] if incremental.get("metadatas") else {},
+                    incremental["distances"][0][i] if incremental.get("distances") else 0.0,
+                ))
+        rows.sort(key=lambda row: row[3])
+        rows = rows[:MAX_CHUNKS_PER_SCOPE]
+        with self._lock:
+            self.chunks_reused += reused
+        return {
+            "ids": [[r[0] for r in rows]],
+            "documents": [[r[1] for r in rows]],
+            "metadatas": [[r[2] for r in rows]],
+            "distances": [[r[3] for r in rows]],
+        }
+
+    def record_hit(self):
+        with self._lock:
+            self.hits += 1
+
+    def put(self, convo_id: str, question: str, embedding, results: Dict[str, dict]):
+        chunks = {}
+        for scope, res in results.items():
+            if not (res.get("ids") and res["ids"][0]):
+                continue
+            distances = res["distances"][0] if res.get("distances") else [0.0] * len(res["ids"][0])
+            chunks[scope] = [
+                (res["ids"][0][i], res["documents"][0][i], res["metadatas"][0][i] if res.get("metadatas") else {}, distances[i])
+                for i in range(len(res["ids"][0]))
+            ][:MAX_CHUNKS_PER_SCOPE]
+
+        entry = _Entry(question, _unit(embedding), chunks, time.monotonic() + self.ttl)
+        with self._lock:
+            self._entries[convo_id] = entry
+            self._entries.move_to_end(convo_id)
+            while len(self._entries) > self.max_conversations:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, convo_id: str):
+        """Call when a conversation's documents change: its cached chunks may be stale."""
+        with self._lock:
+            self._entries.pop(convo_id, None)
+
+    def clear(self):
+        """Call when the global corpus changes."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        return {
+            "conversations": len(self._entries),
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "expired": self.expired,
+            "hit_rate": round(self.hits / self.lookups, 4) if self.lookups else 0.0,
+            "chunks_reused": self.chunks_reused,
+        }
+
+
+working_set = WorkingSet()
@@ -0,0 +1,130 @@
+"""
+Before/after benchmark of the response layer (app/responses.py).
+
+"before" is FastAPI's default path for an endpoint returning a plain dict with
+a response_model: validate into the schema, dump it to JSON-able data and
+render it with json.dumps. "after" renders the dict directly with
+FastJSONResponse (orjson when installed). Compressed sizes and times are
+reported for gzip and, when installed, brotli.
+
+    python bench_serialization.py --messages 500 --answer-chars 2000
+"""
+import argparse
+import gzip
+import json
+import random
+import time
+
+from fastapi.encoders import jsonable_encoder
+
+from app.responses import FastJSONResponse, orjson, brotli, GZIP_LEVEL, BROTLI_QUALITY
+from app.schemas.chat import ChatResponse
+from app.schemas.conversation import HistoryResponse
+
+
+# Answers are prose about the standard: a small vocabulary compresses like the real thing
+VOCABULARY = (
+    "the organization shall determine external and internal issues relevant to its purpose quality management "
+    "system scope processes documented information leadership commitment customer focus policy roles "
+    "responsibilities authorities risks opportunities objectives planning changes resources people infrastructure "
+    "environment monitoring measuring traceability knowledge competence awareness communication control operation "
+    "requirements products services design development suppliers release nonconforming outputs evaluation audit "
+    "management review improvement corrective action clause evidence records retained maintained ensure"
+).split()
+
+
+def _text(rng: random.Random, chars: int) -> str:
+    words, length = [], 0
+    while length < chars:
+        word = rng.choice(VOCABULARY)
+        words.append(word)
+        length += len(word) + 1
+    return " ".join(words)[:chars]
+
+
+def history_payload(n_messages: int, answer_chars: int, seed: int = 0) -> dict:
+    rng = random.Random(seed)
+    return {
+        "history": [
+            {
+                "id": i + 1,
+                "role": "user" if i % 2 == 0 else "assistant",
+                "content": _text(rng, 120 if i % 2 == 0 else answer_chars),
+                "timestamp": f"2026-01-01T00:{i // 60 % 60:02d}:{i % 60:02d}",
+            }
+            for i in range(n_messages)
+        ],
+        "next_cursor": None,
+    }
+
+
+def ask_payload(seed: int = 0) -> dict:
+    rng = random.Random(seed)
+    return {
+        "answer": _text(rng, 3000),
+        "citations": [
+            {"source": f"doc_{i}.pdf", "doc": _text(rng, 200) + "...", "chunk_id": f"global_doc_{i}.pdf_{i}"}
+            for i in range(10)
+        ],
+        "degraded": False,
+        "degradations": [],
+    }
+
+
+def default_path(model, content: dict) -> bytes:
+    # What FastAPI does with a dict and a response_model, then JSONResponse.render
+    data = model.model_validate(jsonable_encoder(content)).model_dump(mode="json")
+    return json.dumps(data, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+
+def fast_path(content: dict) -> bytes:
+    return FastJSONResponse(content).body
+
+
+def timed(fn, repeat: int):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def run(name: str, model, content: dict, repeat: int):
+    before_time, before_body = timed(lambda: default_path(model, content), repeat)
+    after_time, after_body = timed(lambda: fast_path(content), repeat)
+    assert json.loads(before_body) == json.loads(after_body), "both paths must produce the same document"
+
+    print(f"\n{name}: {len(after_body) / 1024:.1f} KiB of JSON")
+    print(f"  {'serialization':<28}{'best of ' + str(repeat):>14}")
+    print(f"  {'default (validate + json)':<28}{before_time * 1000:>11.2f} ms")
+    print(f"  {'FastJSONResponse':<28}{after_time * 1000:>11.2f} ms   x{before_time / after_time:.1f}")
+
+    codecs = [("gzip", lambda: gzip.compress(after_body, compresslevel=GZIP_LEVEL))]
+    if brotli is not None:
+        codecs.append(("br", lambda: brotli.compress(after_body, quality=BROTLI_QUALITY)))
+    for codec, compress in codecs:
+        codec_time, compressed = timed(compress, repeat)
+        print(
+            f"  {codec:<28}{codec_time * 1000:>11.2f} ms   "
+            f"{len(compressed) / 1024:.1f} KiB ({len(after_body) / len(compressed):.1f}:1)"
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Response serialization and compression benchmark")
+    parser.add_argument("--messages", type=int, default=500, help="Messages in the history page (max page size: 500)")
+    parser.add_argument("--answer-chars", type=int, default=2000, help="Length of each assistant answer")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    print(f"JSON encoder: {'orjson' if orjson is not None else 'json (orjson not installed)'}; "
+          f"brotli: {'yes' if brotli is not None else 'not installed'}")
+    run(f"history ({args.messages} messages)", HistoryResponse,
+        history_payload(args.messages, args.answer_chars), args.repeat)
+    run("ask (10 citations)", ChatResponse, ask_payload(), args.repeat * 10)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
 import chromadb
 from chromadb.config import Settings
+import argparse
 import os
 
 def inspect():
@@ -65,5 +66,36 @@ def inspect():
     except Exception as e:
         print(f"❌ Error inspecting DB: {e}")
 
+def inspect_snapshot(path):
+    # Imported lazily so inspecting a live DB doesn't need numpy/app imports
+    from app.snapshot import Snapshot, SnapshotError
+
+    print(f"🔍 Inspecting snapshot at: {path}")
+    try:
+        snap = Snapshot(path, verify=True)
+    except SnapshotError as e:
+        print(f"❌ Invalid snapshot: {e}")
+        return
+
+    manifest = snap.manifest
+    print(f"✅ Checksums verified ({len(manifest['files'])} files)")
+    print(f"🧠 Embedding model: {manifest['embedding_model']} (dim {manifest['dim']})")
+    print(f"🕒 Created at: {manifest['created_at']}  Scope: {manifest.get('scope') or 'all'}")
+    print(f"📄 Total Chunks: {manifest['count']}")
+    total_bytes = sum(f["bytes"] for f in manifest["files"].values())
+    print(f"💾 Size on disk: {total_bytes / (1024 * 1024):.1f} MiB")
+
+    print("\n📊 Document Statistics:")
+    print(f"{'Document Source':<50} | {'Scope':<20} | {'Chunks'}")
+    print("-" * 85)
+    for (src, scp), quantity in sorted(snap.stats().items()):
+        print(f"{src:<50} | {scp:<20} | {quantity}")
+
 if __name__ == "__main__":
-    inspect()
+    parser = argparse.ArgumentParser(description="Inspect the ChromaDB store or a snapshot")
+    parser.add_argument("--snapshot", help="Path to a snapshot directory (see app/snapshot.py)")
+    args = parser.parse_args()
+    if args.snapshot:
+        inspect_snapshot(args.snapshot)
+    else:
+        inspect()